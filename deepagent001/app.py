@@ -1,9 +1,15 @@
+import asyncio
 import os
 from typing import Literal
-from tavily import TavilyClient
 from deepagents import create_deep_agent
+from search_cache import SearchCache, search_mode
+from batch_search import agent_backend_from_env, search_many
 
-tavily_client = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
+# SEARCH_BACKEND=record saves every result served (cached or live) to SEARCH_RECORDINGS; SEARCH_BACKEND=replay serves them offline.
+# Replay serves the recordings directly, so it needs no cache file.
+search_cache = None if search_mode(os.environ) == "replay" else SearchCache(os.environ.get("SEARCH_CACHE_PATH", ".search_cache.sqlite"))
+# One backend serves both tools, so they share the cache and (in record mode) a single recorder and lock.
+search_backend = agent_backend_from_env(cache=search_cache)
 
 def internet_search(
     query: str,
@@ -12,7 +18,7 @@ def internet_search(
     include_raw_content: bool = False,
 ):
     """Run a web search"""
-    return tavily_client.search(
+    return search_backend.search(
         query,
         max_results=max_results,
         include_raw_content=include_raw_content,
@@ -20,6 +26,22 @@ def internet_search(
     )
 
 
+async def internet_search_batch(
+    queries: list[str],
+    max_results: int = 5,
+    topic: Literal["general", "news", "finance"] = "general",
+    include_raw_content: bool = False,
+):
+    """Run several web searches concurrently and return their results merged, one entry per URL"""
+    return await search_many(
+        search_backend,
+        queries,
+        max_results=max_results,
+        include_raw_content=include_raw_content,
+        topic=topic,
+    )
+
+
 #
 
 # System prompt to steer the agent to be an expert researcher
@@ -30,15 +52,30 @@ You have access to an internet search tool as your primary means of gathering in
 ## `internet_search`
 
 Use this to run an internet search for a given query. You can specify the max number of results to return, the topic, and whether raw content should be included.
+
+## `internet_search_batch`
+
+Use this instead of several `internet_search` calls when you already know the queries you need: it runs them all at once and returns one de-duplicated list of results, each tagged with the queries that found it.
 """
 
 agent = create_deep_agent(
-    tools=[internet_search],
+    tools=[internet_search, internet_search_batch],
     system_prompt=research_instructions
 )
 
-result = agent.invoke({"messages": [{"role": "user", "content": "What is langgraph?"}]})
+
+async def run(question):
+    # The batch tool is async, so the agent runs under ainvoke; its pooled HTTP client closes with the loop.
+    try:
+        return await agent.ainvoke({"messages": [{"role": "user", "content": question}]})
+    finally:
+        if hasattr(search_backend, "aclose"):
+            await search_backend.aclose()
+
+
+result = asyncio.run(run("What is langgraph?"))
 
 # Print the agent's response
 print(result["messages"][-1].content)
-
+if search_cache is not None:
+    print(f"Search cache: {search_cache.stats()}")
@@ -0,0 +1,145 @@
+"""Concurrent multi-query search for the internet_search_batch tool.
+
+All queries of one tool call run at once over a single pooled httpx.AsyncClient, at most
+``max_concurrency`` requests in flight, each with its own timeout and retried with exponential backoff on
+timeouts, connection errors, 429 and 5xx. Both tools share one backend (see agent_backend_from_env), so
+batch searches go through the same SearchCache and recorder as internet_search. Results are merged and
+de-duplicated by URL, and raw page content is trimmed before it reaches the model.
+"""
+
+import asyncio
+import os
+import random
+from urllib.parse import urlsplit, urlunsplit
+
+from search_cache import ReplayBackend, cache_key, search_mode, wrap_backend
+
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RAW_CHARS = 4000
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+async def with_retries(call, retries=3, backoff=0.5, retry_on=(RetryableError,), sleep=asyncio.sleep):
+    """Await ``call()``, retrying up to ``retries`` times with jittered exponential backoff (or Retry-After)."""
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except retry_on as e:
+            if attempt == retries:
+                raise
+            delay = getattr(e, "retry_after", None) or backoff * 2 ** attempt
+            await sleep(delay * random.uniform(0.8, 1.2))
+
+
+class AsyncTavilySearch:
+    """Tavily search over one pooled httpx.AsyncClient, opened on first use in the running event loop.
+
+    ``search`` is delegated to ``sync_client`` (a TavilyClient) when given, so one instance can serve both tools.
+    """
+
+    def __init__(self, api_key, max_concurrency=4, timeout=15.0, retries=3, backoff=0.5, sync_client=None, transport=None):
+        self.api_key = api_key
+        self.max_concurrency, self.timeout, self.retries, self.backoff = max_concurrency, timeout, retries, backoff
+        self.sync_client, self.transport = sync_client, transport
+        self.client = None
+        self.semaphore = None
+
+    def _open(self):
+        if self.client is None:
+            import httpx
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                transport=self.transport,
+            )
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.client
+
+    def search(self, query, max_results=5, topic="general", include_raw_content=False):
+        return self.sync_client.search(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+
+    async def asearch(self, query, max_results=5, topic="general", include_raw_content=False):
+        import httpx
+        client = self._open()
+        payload = {"query": query, "max_results": max_results, "topic": topic, "include_raw_content": include_raw_content}
+
+        # The semaphore is held per request, not across retries, so backoff sleeps don't block other queries.
+        async def attempt():
+            try:
+                async with self.semaphore:
+                    response = await client.post(TAVILY_SEARCH_URL, json=payload)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                raise RetryableError(f"{type(e).__name__}: {e}") from e
+            if response.status_code in RETRY_STATUSES:
+                retry_after = response.headers.get("Retry-After")
+                raise RetryableError(f"HTTP {response.status_code}", float(retry_after) if retry_after and retry_after.isdigit() else None)
+            response.raise_for_status()
+            return response.json()
+
+        return await with_retries(attempt, self.retries, self.backoff)
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+def agent_backend_from_env(environ=os.environ, cache=None):
+    """One backend with ``search`` and ``asearch`` for both search tools, chosen by SEARCH_BACKEND (see search_cache.search_mode).
+
+    Live searches go through ``cache`` when one is given, and in record mode a single recorder appends to SEARCH_RECORDINGS.
+    """
+    mode = search_mode(environ)
+    if mode == "replay":
+        return ReplayBackend(environ.get("SEARCH_RECORDINGS", "search_recordings.jsonl"))
+    from tavily import TavilyClient
+    api_key = environ["TAVILY_API_KEY"]
+    live = AsyncTavilySearch(api_key, max_concurrency=int(environ.get("SEARCH_CONCURRENCY", 4)),
+                             timeout=float(environ.get("SEARCH_TIMEOUT", 15)), sync_client=TavilyClient(api_key=api_key))
+    return wrap_backend(live, mode, environ, cache)
+
+
+def url_key(url):
+    """URL with scheme/host case, fragment and trailing slash ignored, for de-duplication."""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), parts.query, ""))
+
+
+def merge_results(queries, responses, max_raw_chars=MAX_RAW_CHARS):
+    """One result list for all queries: first occurrence of each URL wins (keeping the best score), raw content trimmed."""
+    merged, errors = {}, {}
+    for query, response in zip(queries, responses):
+        if isinstance(response, Exception):
+            errors[query] = f"{type(response).__name__}: {response}"
+            continue
+        for item in response.get("results", []):
+            key = url_key(item.get("url", ""))
+            if key in merged:
+                seen = merged[key]
+                seen["queries"].append(query)
+                seen["score"] = max(seen.get("score") or 0, item.get("score") or 0)
+                continue
+            item = dict(item, queries=[query])
+            raw = item.get("raw_content")
+            if raw and len(raw) > max_raw_chars:
+                item["raw_content"] = raw[:max_raw_chars] + f" … [{len(raw) - max_raw_chars} more characters trimmed]"
+            merged[key] = item
+    return {"queries": list(queries), "results": list(merged.values()), "errors": errors}
+
+
+async def search_many(backend, queries, max_results=5, topic="general", include_raw_content=False, max_raw_chars=MAX_RAW_CHARS):
+    """Run ``queries`` concurrently on ``backend`` (identical ones once) and merge the results."""
+    unique = {}
+    for query in queries:
+        unique.setdefault(cache_key(query, max_results, topic, include_raw_content), query)
+    queries = list(unique.values())
+    responses = await asyncio.gather(*(backend.asearch(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+                                       for query in queries), return_exceptions=True)
+    return merge_results(queries, responses, max_raw_chars)
@@ -0,0 +1,219 @@
+"""Caching layer and offline backends for the internet_search tool.
+
+Results are keyed on the normalized (query, max_results, topic, include_raw_content) tuple and kept in
+an in-memory LRU in front of a SQLite file, so repeated searches within and across agent runs skip the
+API. Entries expire per topic: news goes stale in minutes, general results keep for days. The SQLite file
+is swept of expired rows when opened, and of the soonest-expiring ones whenever it grows past ``max_rows``.
+
+Backends are anything with a tavily-style ``search(query, max_results=, topic=, include_raw_content=)``
+(and ``asearch`` for the async batch tool, see batch_search.py): ``CachedBackend`` serves one through a
+SearchCache, ``RecordingBackend`` wraps one and appends every result it returns to a JSON-lines file, and
+``ReplayBackend`` serves such a file without the network. Recording wraps the cache, so cache hits are
+recorded too and a replay covers everything the agent was served. The agent's backend is assembled by
+batch_search.agent_backend_from_env.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a cached result stays fresh, per search topic.
+TOPIC_TTLS = {"news": 15 * 60, "finance": 60 * 60, "general": 7 * 24 * 3600}
+DEFAULT_TTL = 24 * 3600
+
+
+def normalize_query(query):
+    """Case-fold and collapse whitespace so trivially different spellings share a cache entry."""
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+
+def cache_key(query, max_results=5, topic="general", include_raw_content=False):
+    params = [normalize_query(query), int(max_results), topic, bool(include_raw_content)]
+    return hashlib.sha256(json.dumps(params).encode()).hexdigest()
+
+
+class SearchCache:
+    """In-memory LRU of up to ``max_entries`` results backed by an optional SQLite file at ``path`` of up to ``max_rows``."""
+
+    def __init__(self, path=None, max_entries=256, ttls=None, clock=time.time, max_rows=50_000):
+        self.max_entries, self.max_rows = max_entries, max_rows
+        self.ttls = TOPIC_TTLS if ttls is None else ttls
+        self.clock = clock
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "stores": 0}
+        self.db, self.disk_rows = None, 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, expires REAL, value TEXT)")
+            self.db.commit()
+            self._sweep()
+
+    def ttl(self, topic):
+        return self.ttls.get(topic, DEFAULT_TTL)
+
+    def get(self, key):
+        """Cached result for ``key``, or None if absent or expired."""
+        now = self.clock()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and entry[0] > now:
+                self.memory.move_to_end(key)
+                self.metrics["memory_hits"] += 1
+                return json.loads(entry[1])
+            if entry is not None:
+                del self.memory[key]
+            # Another process sharing the file may have stored a fresher result.
+            row = self.db.execute("SELECT expires, value FROM results WHERE key = ?", (key,)).fetchone() if self.db else None
+            if row is not None and row[0] > now:
+                self._remember(key, row)
+                self.metrics["disk_hits"] += 1
+                return json.loads(row[1])
+            if row is not None:
+                self.db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.db.commit()
+            self.metrics["expired"] += entry is not None or row is not None
+            self.metrics["misses"] += 1
+            return None
+
+    def put(self, key, topic, result):
+        entry = (self.clock() + self.ttl(topic), json.dumps(result))
+        with self.lock:
+            self._remember(key, entry)
+            if self.db:
+                self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (key, *entry))
+                self.db.commit()
+                self.disk_rows += 1
+                if self.disk_rows > self.max_rows:
+                    self._sweep()
+            self.metrics["stores"] += 1
+
+    def _sweep(self):
+        """Delete expired rows, then the soonest to expire until the file is back to 90% of max_rows."""
+        self.db.execute("DELETE FROM results WHERE expires <= ?", (self.clock(),))
+        self.db.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                        (int(self.max_rows * 0.9),))
+        self.db.commit()
+        self.disk_rows = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _remember(self, key, entry):
+        self.memory[key] = tuple(entry)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def search(self, backend, query, max_results=5, topic="general", include_raw_content=False):
+        """Serve the search from the cache, calling ``backend.search`` and storing its result on a miss."""
+        key = cache_key(query, max_results, topic, include_raw_content)
+        result = self.get(key)
+        if result is None:
+            result = backend.search(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+            self.put(key, topic, result)
+        return result
+
+    def stats(self):
+        hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+        lookups = hits + self.metrics["misses"]
+        return {**self.metrics, "hit_rate": round(hits / lookups, 3) if lookups else None, "entries": len(self.memory), "disk_rows": self.disk_rows}
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+
+class CachedBackend:
+    """Serve ``backend`` through ``cache``: only misses reach it, and their results are stored."""
+
+    def __init__(self, backend, cache):
+        self.backend, self.cache = backend, cache
+
+    def search(self, query, max_results=5, topic="general", include_raw_content=False):
+        return self.cache.search(self.backend, query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+
+    async def asearch(self, query, max_results=5, topic="general", include_raw_content=False):
+        # SQLite lookups and writes block, so they run in a worker thread rather than on the event loop.
+        key = cache_key(query, max_results, topic, include_raw_content)
+        result = await asyncio.to_thread(self.cache.get, key)
+        if result is None:
+            result = await self.backend.asearch(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+            await asyncio.to_thread(self.cache.put, key, topic, result)
+        return result
+
+    async def aclose(self):
+        if hasattr(self.backend, "aclose"):
+            await self.backend.aclose()
+
+
+class RecordingBackend:
+    """Pass searches through to ``backend`` and append each (key, params, result) to a JSON-lines file."""
+
+    def __init__(self, backend, path):
+        self.backend, self.path = backend, path
+        self.lock = threading.Lock()
+
+    def search(self, query, max_results=5, topic="general", include_raw_content=False):
+        result = self.backend.search(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+        return self._record(query, max_results, topic, include_raw_content, result)
+
+    async def asearch(self, query, max_results=5, topic="general", include_raw_content=False):
+        result = await self.backend.asearch(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+        return await asyncio.to_thread(self._record, query, max_results, topic, include_raw_content, result)
+
+    async def aclose(self):
+        if hasattr(self.backend, "aclose"):
+            await self.backend.aclose()
+
+    def _record(self, query, max_results, topic, include_raw_content, result):
+        record = {"key": cache_key(query, max_results, topic, include_raw_content), "query": query, "max_results": max_results,
+                  "topic": topic, "include_raw_content": include_raw_content, "result": result}
+        with self.lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        return result
+
+
+class ReplayBackend:
+    """Serve results recorded by RecordingBackend; a search that was never recorded raises KeyError."""
+
+    def __init__(self, path):
+        self.results = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.results[record["key"]] = record["result"]
+
+    def search(self, query, max_results=5, topic="general", include_raw_content=False):
+        key = cache_key(query, max_results, topic, include_raw_content)
+        if key not in self.results:
+            raise KeyError(f"no recorded result for {query!r} (max_results={max_results}, topic={topic}, include_raw_content={include_raw_content})")
+        return self.results[key]
+
+    async def asearch(self, query, max_results=5, topic="general", include_raw_content=False):
+        return self.search(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+
+
+SEARCH_MODES = ("tavily", "record", "replay")
+
+
+def search_mode(environ):
+    """SEARCH_BACKEND: tavily (default), record or replay (both use SEARCH_RECORDINGS); checked before tavily is imported."""
+    mode = environ.get("SEARCH_BACKEND", "tavily")
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"SEARCH_BACKEND must be tavily, record or replay, not {mode!r}")
+    return mode
+
+
+def wrap_backend(live, mode, environ, cache=None):
+    """``live`` behind ``cache`` (if any), behind a recorder in record mode."""
+    backend = CachedBackend(live, cache) if cache is not None else live
+    if mode == "record":
+        return RecordingBackend(backend, environ.get("SEARCH_RECORDINGS", "search_recordings.jsonl"))
+    return backend
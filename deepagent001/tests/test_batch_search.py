@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+import pytest
+
+from batch_search import AsyncTavilySearch, merge_results
+
+
+@pytest.fixture
+def httpx():
+    return pytest.importorskip("httpx")
+
+
+def tavily_transport(httpx, handler):
+    """MockTransport answering each POST with ``handler(query)``, given as (status, headers) or a result dict."""
+    async def respond(request):
+        query = json.loads(request.content)["query"]
+        answer = await handler(query)
+        if isinstance(answer, tuple):
+            return httpx.Response(answer[0], headers=answer[1])
+        return httpx.Response(200, json=answer)
+    return httpx.MockTransport(respond)
+
+
+def result(query):
+    return {"results": [{"url": f"https://example.com/{query}", "title": query}]}
+
+
+# --- concurrent batch search (user-021) ------------------------------------------------------------------------
+
+def test_retries_on_429_and_5xx(httpx):
+    statuses = iter([(429, {"Retry-After": "0"}), (503, {})])
+
+    async def handler(query):
+        return next(statuses, None) or result(query)
+
+    search = AsyncTavilySearch("key", backoff=0, transport=tavily_transport(httpx, handler))
+
+    async def run():
+        try:
+            return await search.asearch("langgraph")
+        finally:
+            await search.aclose()
+    assert asyncio.run(run()) == result("langgraph")
+
+
+def test_gives_up_after_the_last_retry(httpx):
+    async def handler(query):
+        return (503, {})
+
+    search = AsyncTavilySearch("key", retries=2, backoff=0, transport=tavily_transport(httpx, handler))
+    with pytest.raises(Exception, match="HTTP 503"):
+        asyncio.run(search.asearch("langgraph"))
+
+
+def test_at_most_max_concurrency_requests_in_flight(httpx):
+    in_flight, peak = 0, []
+
+    async def handler(query):
+        nonlocal in_flight
+        in_flight += 1
+        peak.append(in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return result(query)
+
+    search = AsyncTavilySearch("key", max_concurrency=2, transport=tavily_transport(httpx, handler))
+
+    async def run():
+        try:
+            return await asyncio.gather(*(search.asearch(f"q{i}") for i in range(8)))
+        finally:
+            await search.aclose()
+    assert [r["results"][0]["title"] for r in asyncio.run(run())] == [f"q{i}" for i in range(8)]
+    assert max(peak) == 2
+
+
+def test_backoff_does_not_hold_a_request_slot(httpx):
+    throttled, finished = set(), []
+
+    async def handler(query):
+        if query == "slow" and query not in throttled:
+            throttled.add(query)
+            return (429, {"Retry-After": "1"})
+        return result(query)
+
+    search = AsyncTavilySearch("key", max_concurrency=1, transport=tavily_transport(httpx, handler))
+
+    async def run(query):
+        await search.asearch(query)
+        finished.append(query)
+
+    async def both():
+        try:
+            slow = asyncio.create_task(run("slow"))
+            await asyncio.sleep(0.05)
+            await asyncio.wait_for(run("fast"), 0.5)
+            await slow
+        finally:
+            await search.aclose()
+    asyncio.run(both())
+    assert finished == ["fast", "slow"]
+
+
+def test_merge_keeps_one_entry_per_url_and_trims_raw_content():
+    responses = [{"results": [{"url": "https://Example.com/a/", "score": 0.2, "raw_content": "x" * 50}]},
+                 {"results": [{"url": "https://example.com/a", "score": 0.9}]},
+                 RuntimeError("boom")]
+    merged = merge_results(["one", "two", "three"], responses, max_raw_chars=10)
+    [item] = merged["results"]
+    assert item["queries"] == ["one", "two"] and item["score"] == 0.9
+    assert item["raw_content"].startswith("x" * 10 + " … [40 more")
+    assert merged["errors"] == {"three": "RuntimeError: boom"}
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import sys
+
+import pytest
+
+from batch_search import agent_backend_from_env, search_many
+from search_cache import CachedBackend, ReplayBackend, SearchCache, cache_key, wrap_backend
+
+
+class FakeSearch:
+    """Tavily-shaped backend that counts the searches reaching it."""
+
+    def __init__(self):
+        self.calls = []
+
+    def search(self, query, max_results=5, topic="general", include_raw_content=False):
+        self.calls.append(query)
+        return {"query": query, "results": [{"url": f"https://example.com/{query.strip().lower()}", "title": query, "score": 0.5}]}
+
+    async def asearch(self, query, max_results=5, topic="general", include_raw_content=False):
+        return self.search(query, max_results=max_results, topic=topic, include_raw_content=include_raw_content)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def read_recordings(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+# --- cache (user-020) ------------------------------------------------------------------------------------------
+
+def test_equivalent_queries_share_a_cache_entry():
+    assert cache_key("What is  LangGraph? ") == cache_key("what is langgraph?")
+    assert cache_key("langgraph", topic="news") != cache_key("langgraph")
+
+
+def test_entries_expire_per_topic():
+    clock, backend = Clock(), FakeSearch()
+    cache = SearchCache(clock=clock)
+    cache.search(backend, "markets", topic="news")
+    cache.search(backend, "langgraph")
+    clock.now += 16 * 60
+    cache.search(backend, "markets", topic="news")
+    cache.search(backend, "langgraph")
+    assert backend.calls == ["markets", "langgraph", "markets"]
+    assert cache.stats()["expired"] == 1
+
+
+def test_entries_evicted_from_memory_are_served_from_disk(tmp_path):
+    backend = FakeSearch()
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for query in ("a", "b", "c", "a"):
+        cache.search(backend, query)
+    assert backend.calls == ["a", "b", "c"]
+    assert cache.stats()["disk_hits"] == 1
+    cache.close()
+
+    reopened = SearchCache(str(tmp_path / "cache.sqlite"))
+    reopened.search(backend, "b")
+    assert backend.calls == ["a", "b", "c"]
+
+
+def test_disk_store_is_swept_of_expired_and_excess_rows(tmp_path):
+    clock, backend, path = Clock(), FakeSearch(), str(tmp_path / "cache.sqlite")
+    cache = SearchCache(path, max_entries=1, clock=clock, max_rows=10)
+    cache.search(backend, "markets", topic="news")
+    for i in range(8):
+        clock.now += 1
+        cache.search(backend, f"query {i}")
+    cache.close()
+
+    clock.now += 16 * 60
+    cache = SearchCache(path, max_entries=1, clock=clock, max_rows=10)
+    assert cache.stats()["disk_rows"] == 8
+    for i in range(8, 11):
+        clock.now += 1
+        cache.search(backend, f"query {i}")
+    assert cache.stats()["disk_rows"] == 9
+    cache.search(backend, "query 0")
+    cache.search(backend, "query 2")
+    assert backend.calls.count("query 0") == 2 and backend.calls.count("query 2") == 1
+
+
+def test_record_mode_records_cache_hits_and_replays_them(tmp_path):
+    environ = {"SEARCH_BACKEND": "record", "SEARCH_RECORDINGS": str(tmp_path / "recordings.jsonl")}
+    live = FakeSearch()
+    backend = wrap_backend(live, "record", environ, SearchCache())
+    first = backend.search("langgraph")
+    assert backend.search("LangGraph") == first
+    assert live.calls == ["langgraph"]
+    assert [record["query"] for record in read_recordings(environ["SEARCH_RECORDINGS"])] == ["langgraph", "LangGraph"]
+
+    replay = ReplayBackend(environ["SEARCH_RECORDINGS"])
+    assert replay.search("LangGraph") == first
+    with pytest.raises(KeyError):
+        replay.search("never searched")
+
+
+def test_batch_search_records_cache_hits(tmp_path):
+    environ = {"SEARCH_BACKEND": "record", "SEARCH_RECORDINGS": str(tmp_path / "recordings.jsonl")}
+    live = FakeSearch()
+    backend = wrap_backend(live, "record", environ, SearchCache())
+    merged = asyncio.run(search_many(backend, ["a", "A ", "b"]))
+    asyncio.run(search_many(backend, ["a", "b"]))
+    assert sorted(live.calls) == ["a", "b"]
+    assert len(merged["results"]) == 2
+    assert len(read_recordings(environ["SEARCH_RECORDINGS"])) == 4
+
+
+def test_cached_backend_serves_async_and_sync_from_one_cache():
+    live, cache = FakeSearch(), SearchCache()
+    backend = CachedBackend(live, cache)
+    asyncio.run(backend.asearch("langgraph"))
+    backend.search("langgraph")
+    assert live.calls == ["langgraph"]
+
+
+def test_invalid_mode_is_rejected_before_tavily_is_needed(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tavily", None)
+    with pytest.raises(ValueError, match="SEARCH_BACKEND"):
+        agent_backend_from_env({"SEARCH_BACKEND": "replay-ish"})
+
+
+def test_replay_mode_needs_no_api_key(tmp_path):
+    path = tmp_path / "recordings.jsonl"
+    path.write_text("")
+    assert isinstance(agent_backend_from_env({"SEARCH_BACKEND": "replay", "SEARCH_RECORDINGS": str(path)}), ReplayBackend)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+benchmark.py: Scaling benchmarks for syndata.py and every ecomm.py stage.
+
+Generates datasets of fixed seed and size through syndata.main, times and memory-profiles each stage of
+ecomm.py on them separately, writes the results as JSON and compares them with a stored baseline.
+
+    python benchmark.py --sizes 10k,100k --output bench_results.json --baseline bench_baseline.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import syndata
+import ecomm
+
+SIZE_SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+BENCH_DAYS = 730
+
+def parse_size(text):
+    text = text.strip().lower()
+    return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]]) if text[-1] in SIZE_SUFFIXES else int(text)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark syndata.py and the ecomm.py stages at several dataset sizes")
+    parser.add_argument('--sizes', type=str, default='10k,100k,1m', help='Comma-separated target order counts, e.g. 10k,100k,1m')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the generated datasets')
+    parser.add_argument('--workdir', type=str, default='bench_data', help='Where generated datasets are kept and reused')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Dataset format to generate and load')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage; the median is reported')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the extra tracemalloc run that measures peak allocations')
+    parser.add_argument('--output', type=str, default='bench_results.json', help='Machine-readable results file')
+    parser.add_argument('--baseline', type=str, default=None, help='Baseline results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Write these results to --baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='Allowed relative slowdown or memory growth before flagging a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='Ignore timing differences smaller than this (noise floor)')
+    return parser.parse_args()
+
+def generate_dataset(target_orders, args):
+    """Generate (or reuse) a seeded dataset with roughly target_orders orders; returns its folder and the generation time (None if reused)."""
+    folder = os.path.join(args.workdir, f"orders_{target_orders}_seed{args.seed}_{args.format}")
+    marker = os.path.join(folder, "_bench_complete.json")
+    if os.path.exists(marker):
+        return folder, None
+    start = datetime.date(2020, 1, 1)
+    # Join dates are uniform over the range, so about half of the daily order slots find a joined customer.
+    orders_per_day = max(1, round(2 * target_orders / BENCH_DAYS))
+    gen_args = syndata.parse_args([
+        '--customers', str(min(100_000, max(1_000, target_orders // 20))), '--products', '3000', '--stores', '250',
+        '--orders-per-day', str(orders_per_day), '--from', start.isoformat(), '--to', (start + datetime.timedelta(days=BENCH_DAYS - 1)).isoformat(),
+        '--seed', str(args.seed), '--format', args.format, '--output', folder,
+    ])
+    t0 = time.perf_counter()
+    syndata.main(gen_args)
+    seconds = time.perf_counter() - t0
+    with open(marker, 'w') as f:
+        json.dump({'generate_seconds': seconds}, f)
+    return folder, seconds
+
+def measure(fn, repeat, memory):
+    """Median wall time of `repeat` calls, peak traced allocation (MB) of one more call, and whether any call failed."""
+    # Analysis functions catch their own exceptions and return an error summary; ecomm counts those.
+    errors = ecomm._ERROR_COUNT
+    times = []
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        peak_mb = None
+        if memory:
+            tracemalloc.start()
+            try:
+                fn()
+                peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+    except Exception as e:
+        print(ecomm.exception_message("benchmark", e))
+        return None, None, True
+    return statistics.median(times), peak_mb, ecomm._ERROR_COUNT > errors
+
+def benchmark_dataset(folder, args):
+    """Time each ecomm.py stage on one dataset; returns (number of orders, [(stage, seconds, peak_mb, failed)])."""
+    quiet = True
+    dfs = ecomm.load_data(folder, quiet, args.format)
+    fact = ecomm.build_sales_fact(dfs['customers'], dfs['products'], dfs['orders'], dfs['lineitems'], quiet)
+    customers, products, orders = dfs['customers'], dfs['products'], dfs['orders']
+    stages = [
+        ('load_data', lambda: ecomm.load_data(folder, quiet, args.format)),
+        ('build_sales_fact', lambda: ecomm.build_sales_fact(customers, products, orders, dfs['lineitems'], quiet)),
+        ('customer_analytics', lambda: ecomm.customer_analytics(customers, orders, fact, quiet)),
+        ('cohort_analysis', lambda: ecomm.cohort_analysis(customers, fact, quiet)),
+        ('sales_conversion_analysis', lambda: ecomm.sales_conversion_analysis(fact, quiet)),
+        ('product_performance', lambda: ecomm.product_performance(fact, quiet)),
+        ('market_basket_analysis', lambda: ecomm.market_basket_analysis(fact, products, quiet)),
+        ('customer_personalization', lambda: ecomm.customer_personalization(fact, quiet)),
+        ('recommend_products', lambda: ecomm.recommend_products(fact, customers, products, quiet)),
+        ('fraud_detection', lambda: ecomm.fraud_detection(fact, orders, quiet)),
+        ('geo_demo_analysis', lambda: ecomm.geo_demo_analysis(customers, orders, quiet)),
+        ('streaming_aggregates', lambda: ecomm.streaming_aggregates(folder, args.format, customers, products, 250_000, quiet)),
+    ]
+    results = []
+    for name, fn in stages:
+        seconds, peak_mb, failed = measure(fn, args.repeat, not args.no_memory)
+        if failed:
+            print(f"  {name:<28}    FAILED")
+        else:
+            print(f"  {name:<28} {seconds:9.3f} s" + (f" {peak_mb:10.1f} MB" if peak_mb is not None else ""))
+        results.append((name, seconds, peak_mb, failed))
+    return len(orders), results
+
+def compare(results, baseline, tolerance, min_seconds):
+    """Return the regressions: entries slower (or bigger) than the baseline by more than tolerance.
+
+    Failed and untimed (reused dataset) entries on either side are left out; main reports failures separately.
+    """
+    previous = {(r['dataset'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        old = previous.get((r['dataset'], r['stage']))
+        if old is None or r['seconds'] is None or old['seconds'] is None or r['failed'] or old.get('failed'):
+            continue
+        if r['seconds'] > old['seconds'] * (1 + tolerance) and r['seconds'] - old['seconds'] > min_seconds:
+            regressions.append(f"{r['dataset']}/{r['stage']}: {old['seconds']:.3f}s -> {r['seconds']:.3f}s")
+        if r.get('peak_mb') and old.get('peak_mb') and r['peak_mb'] > old['peak_mb'] * (1 + tolerance):
+            regressions.append(f"{r['dataset']}/{r['stage']}: {old['peak_mb']:.1f}MB -> {r['peak_mb']:.1f}MB peak")
+    return regressions
+
+def main():
+    args = parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    for size_text in args.sizes.split(','):
+        target = parse_size(size_text)
+        label = size_text.strip().lower()
+        print(f"\n[{label}] generating dataset...")
+        folder, gen_seconds = generate_dataset(target, args)
+        if gen_seconds is None:
+            print(f"[{label}] reusing {folder}; syndata.main not timed (delete it to time generation)")
+        results.append({'dataset': label, 'stage': 'syndata.main', 'seconds': gen_seconds, 'peak_mb': None, 'orders': None,
+                        'cached': gen_seconds is None, 'failed': False})
+        print(f"[{label}] benchmarking {folder}")
+        n_orders, stage_results = benchmark_dataset(folder, args)
+        results[-1]['orders'] = n_orders
+        for stage, seconds, peak_mb, failed in stage_results:
+            results.append({'dataset': label, 'stage': stage, 'seconds': seconds, 'peak_mb': peak_mb, 'orders': n_orders,
+                            'cached': False, 'failed': failed})
+
+    report = {
+        'meta': {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+                 'platform': platform.platform(), 'seed': args.seed, 'format': args.format, 'repeat': args.repeat},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n[INFO] Results written to {args.output}")
+    failures = [f"{r['dataset']}/{r['stage']}" for r in results if r['failed']]
+    if failures:
+        print("\n[FAILED] These stages reported an error, so their timings are not comparable:")
+        for line in failures:
+            print("  " + line)
+
+    if args.baseline and args.save_baseline and failures:
+        print(f"[INFO] Baseline not saved to {args.baseline} because stages failed.")
+    elif args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Baseline saved to {args.baseline}")
+    elif args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_seconds)
+        if regressions:
+            print("\n[REGRESSION] Slower or larger than the baseline:")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("[INFO] No regressions against the baseline.")
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
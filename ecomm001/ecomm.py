@@ -8,19 +8,27 @@ import argparse
 import os
 import sys
 import traceback
-import random
+import json
+import glob
+import hashlib
+import re
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.ensemble import IsolationForest
-from mlxtend.frequent_patterns import fpgrowth, association_rules
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet
 from io import BytesIO
-from tqdm import tqdm
+from schema import TABLE_SCHEMA, read_csv_args, conform
 import warnings
+# matplotlib, scikit-learn, scipy and reportlab are imported inside the functions that use them, so a run
+# with only a few --sections, or with --output-format json/csv, never pays their import time.
+try:
+    import resource  # peak RSS; not available on Windows
+except ImportError:
+    resource = None
 
 AUTHOR = "Vinaya Sathyanarayana"
 
@@ -30,209 +38,1130 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 def verbose_print(msg, quiet):
     if not quiet: print(msg)
 
+# Errors reported through exception_message so far; _run_section compares it before and after a section.
+_ERROR_COUNT = 0
+
 def exception_message(context, e):
+    global _ERROR_COUNT
+    _ERROR_COUNT += 1
     return f"[{context}] ERROR: {type(e).__name__}: {e}\n" + traceback.format_exc()
 
+TIMING_FIELDS = ['stage', 'wall_s', 'cpu_s', 'max_rss_mb', 'alloc_peak_mb', 'rows_in', 'rows_out', 'cache', 'pid']
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+@contextmanager
+def stage(name, metrics, args, rows_in=None):
+    """Time the enclosed block (wall, CPU, peak RSS, optionally allocations and a cProfile dump) and append its record to `metrics`."""
+    record = {'stage': name, 'rows_in': rows_in, 'rows_out': None, 'cache': None}
+    trace = getattr(args, 'trace_alloc', False) and not tracemalloc.is_tracing()
+    if trace:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if getattr(args, 'profile', False) else None
+    wall, cpu = time.perf_counter(), time.process_time()
+    if profiler: profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(os.path.join(args.datafolder, "profiles"), exist_ok=True)
+            profiler.dump_stats(os.path.join(args.datafolder, "profiles", f"{name.replace(':', '_')}.prof"))
+        record.update(wall_s=round(time.perf_counter() - wall, 4), cpu_s=round(time.process_time() - cpu, 4),
+                      max_rss_mb=max_rss_mb(), alloc_peak_mb=None, pid=os.getpid())
+        if trace:
+            record['alloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            tracemalloc.stop()
+        metrics.append(record)
+
+def write_timings(folder, metrics):
+    """Write the per-stage records as report_timings.json and report_timings.csv next to report.pdf."""
+    with open(os.path.join(folder, "report_timings.json"), 'w') as f:
+        json.dump(metrics, f, indent=2)
+    pd.DataFrame(metrics, columns=TIMING_FIELDS).convert_dtypes().to_csv(os.path.join(folder, "report_timings.csv"), index=False)
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Ecommerce Transaction Analyzer and PDF Reporter")
     parser.add_argument('--datafolder', type=str, default='.', help='Folder with CSVs from syndata.py')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Input format written by syndata.py')
+    parser.add_argument('--jobs', type=int, default=1, help='Run independent report sections in up to N parallel processes')
+    parser.add_argument('--rfm-state', type=str, default=None, help='File holding per-customer RFM aggregates between runs; only orders added since the last run are folded in')
+    parser.add_argument('--cohort-by', choices=['first-order', 'join'], default='first-order', help='Assign customers to the cohort of their first order month or their join month')
+    parser.add_argument('--top-n', type=int, default=10, help='Products recommended per customer in recommendations.csv (0 to skip)')
+    parser.add_argument('--fraud-model', type=str, default=None, help='Fraud model file: trained and saved on first use, loaded on later runs')
+    parser.add_argument('--retrain-fraud', action='store_true', help='Refit the fraud model even if --fraud-model exists')
+    parser.add_argument('--fraud-since', type=str, default=None, help='Only score orders on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--n-jobs', type=int, default=None, help='Cores for fraud model training and scoring (-1 for all)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Out-of-core mode: stream orders/lineitems in chunks of this many rows (basket and fraud sections are skipped)')
+    parser.add_argument('--cache-dir', type=str, default=None, help='Report section cache (default: <datafolder>/.ecomm_cache)')
+    parser.add_argument('--cache-max-mb', type=int, default=512, help='Evict least recently used cache entries beyond this size')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute every section and leave the cache untouched')
+    parser.add_argument('--sections', type=str, default=None, help='Comma-separated sections to run (default all): ' + ','.join(key for key, _, _ in REPORT_SECTIONS))
+    parser.add_argument('--output-format', choices=['pdf', 'json', 'csv'], default='pdf', help='report.pdf, report.json, or report_tables/*.csv (json/csv skip charts and reportlab)')
+    parser.add_argument('--charts', choices=['png', 'vector'], default='png', help='Embed charts as PNG images (cached, rendered on --jobs workers) or as vector drawings')
+    parser.add_argument('--chart-dpi', type=int, default=160, help='Resolution of PNG charts')
+    parser.add_argument('--profile', action='store_true', help='Dump a cProfile file per stage to <datafolder>/profiles/')
+    parser.add_argument('--trace-alloc', action='store_true', help='Record peak Python allocations per stage with tracemalloc (slower)')
     parser.add_argument('-q', '--quiet', action='store_true', help='Quiet mode')
-    return parser.parse_args()
+    args = parser.parse_args()
+    known = [key for key, _, _ in REPORT_SECTIONS]
+    requested = known if args.sections is None else [key.strip() for key in args.sections.split(',') if key.strip()]
+    unknown = sorted(set(requested) - set(known))
+    if not requested:
+        parser.error(f"--sections: no section given; choose from {', '.join(known)}")
+    if unknown:
+        parser.error(f"--sections: unknown section(s) {', '.join(unknown)}; choose from {', '.join(known)}")
+    if args.chunk_size and args.rfm_state:
+        parser.error("--rfm-state cannot be combined with --chunk-size: out-of-core mode always aggregates the full history")
+    args.sections = [key for key in known if key in requested]
+    return args
+
+TABLE_COLUMNS = {table: list(columns) for table, columns in TABLE_SCHEMA.items()}
+
+# Columns each step reads, so load_data only has to parse those. Line items are only read through the sales fact table.
+SECTION_COLUMNS = {
+    'build_sales_fact': {'customers': ['customer_id', 'persona'], 'products': ['product_id', 'product_name', 'category'],
+                         'orders': ['order_id', 'customer_id', 'store_id', 'order_date'], 'lineitems': ['order_id', 'product_id', 'quantity', 'total_amount']},
+    'rfm_state': {'orders': ['order_id', 'customer_id', 'order_date']},
+    'customer_analytics': {'customers': ['gender', 'location']},
+    'cohort_analysis': {'customers': ['customer_id', 'join_date']},
+    'sales_conversion_analysis': {},
+    'product_performance': {},
+    'market_basket_analysis': {'products': ['product_name']},
+    'customer_personalization': {},
+    'recommend_products': {'customers': ['customer_id'], 'products': ['product_id', 'product_name']},
+    'fraud_detection': {'orders': ['order_id', 'order_time', 'payment_method']},
+    'geo_demo_analysis': {'customers': ['customer_id', 'location'], 'orders': ['customer_id']},
+}
 
-def load_data(folder, quiet):
-    files = ['customers.csv', 'products.csv', 'stores.csv', 'orders.csv', 'lineitems.csv']
+def required_columns(sections):
+    """Union of SECTION_COLUMNS over the given analyses, in each table's file column order."""
+    needed = {}
+    for section in sections:
+        for table, cols in SECTION_COLUMNS[section].items():
+            needed.setdefault(table, set()).update(cols)
+    return {table: [c for c in TABLE_COLUMNS[table] if c in cols] for table, cols in needed.items()}
+
+def table_path(folder, table, fmt):
+    if fmt == 'csv':
+        return os.path.join(folder, f"{table}.csv")
+    # syndata.py writes dimension tables as single files and orders/lineitems as month-partitioned directories.
+    path = os.path.join(folder, f"{table}.parquet")
+    return path if os.path.exists(path) else os.path.join(folder, table)
+
+def load_data(folder, quiet, fmt='csv', columns=None):
+    """Load the five tables from CSV or Parquet, typed per schema.TABLE_SCHEMA; `columns` maps table name to the subset of columns to read."""
     dfs = {}
-    for f in files:
-        path = os.path.join(folder, f)
+    for table in TABLE_COLUMNS:
+        cols = columns.get(table) if columns is not None else TABLE_COLUMNS[table]
+        if not cols:
+            continue
+        path = table_path(folder, table, fmt)
         if not os.path.exists(path):
-            raise FileNotFoundError(f"File {f} missing in {folder}.")
-        verbose_print(f"Loading {f}", quiet)
-        dfs[f.replace('.csv', '')] = pd.read_csv(path)
+            raise FileNotFoundError(f"File {os.path.basename(path)} missing in {folder}.")
+        verbose_print(f"Loading {os.path.basename(path)}", quiet)
+        df = pd.read_parquet(path, columns=cols) if fmt == 'parquet' else pd.read_csv(path, usecols=cols, **read_csv_args(table, cols))
+        dfs[table] = conform(df, table)
     return dfs
 
-def plot_to_buf(pltfig):
+def iter_table_chunks(folder, table, fmt, columns, chunk_size):
+    """Yield a table as typed DataFrames of at most chunk_size rows, reading only `columns`."""
+    path = table_path(folder, table, fmt)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File {os.path.basename(path)} missing in {folder}.")
+    if fmt == 'parquet':
+        import pyarrow.dataset as ds
+        for batch in ds.dataset(path, format='parquet', partitioning='hive').to_batches(columns=columns, batch_size=chunk_size):
+            yield conform(batch.to_pandas(), table)
+    else:
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size, **read_csv_args(table, columns)):
+            yield conform(chunk, table)
+
+def streaming_aggregates(folder, fmt, customers, products, chunk_size, quiet):
+    """Aggregates behind the RFM, cohort, sales, product, personalization and geo sections, from orders and lineitems
+    streamed in chunks of chunk_size rows and merge-joined on order_id."""
+    verbose_print(f"Streaming orders and line items in chunks of {chunk_size} rows...", quiet)
+    customer_index = pd.Index(customers['customer_id'])
+    category = pd.Categorical(products['category'])
+    product_name = pd.Categorical(products['product_name'])
+    persona = pd.Categorical(customers['persona'])
+    n_customers, n_names = len(customers), len(product_name.categories)
+
+    frequency = np.zeros(n_customers, dtype=np.int64)
+    first_day = np.full(n_customers, np.iinfo(np.int64).max)
+    last_day = np.full(n_customers, np.iinfo(np.int64).min)
+    monetary = np.zeros(n_customers)
+    category_revenue = np.zeros(len(category.categories))
+    name_quantity = np.zeros(n_names, dtype=np.int64)
+    persona_name_lines = np.zeros((len(persona.categories) + 1) * n_names, dtype=np.int64)
+    monthly = pd.Series(dtype=float)
+    customer_months, pending_months = pd.Series(dtype=float), []
+
+    def add_orders(chunk):
+        pos = customer_index.get_indexer(chunk['customer_id'])
+        chunk['customer_pos'] = pos
+        chunk['day'] = chunk['order_date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+        known = pos >= 0
+        frequency[:] += np.bincount(pos[known], minlength=n_customers)
+        np.minimum.at(first_day, pos[known], chunk['day'].to_numpy()[known])
+        np.maximum.at(last_day, pos[known], chunk['day'].to_numpy()[known])
+        return chunk[['order_id', 'customer_pos', 'day']]
+
+    order_chunks = iter_table_chunks(folder, 'orders', fmt, ['order_id', 'customer_id', 'order_date'], chunk_size)
+    buffer = pd.DataFrame({'order_id': np.empty(0, np.int64), 'customer_pos': np.empty(0, np.int64), 'day': np.empty(0, np.int64)})
+    last_order_id = -1
+    for lines in iter_table_chunks(folder, 'lineitems', fmt, ['order_id', 'product_id', 'quantity', 'total_amount'], chunk_size):
+        if not lines['order_id'].is_monotonic_increasing:
+            raise ValueError("Out-of-core mode needs lineitems sorted by order_id, as syndata.py writes them.")
+        needed = lines['order_id'].iloc[-1]
+        while buffer.empty or buffer['order_id'].iloc[-1] < needed:
+            chunk = next(order_chunks, None)
+            if chunk is None:
+                break
+            if chunk['order_id'].iloc[0] <= last_order_id or not chunk['order_id'].is_monotonic_increasing:
+                raise ValueError("Out-of-core mode needs orders sorted by order_id, as syndata.py writes them.")
+            last_order_id = chunk['order_id'].iloc[-1]
+            buffer = pd.concat([buffer, add_orders(chunk)], ignore_index=True)
+
+        order_ids = buffer['order_id'].to_numpy()
+        pos = np.minimum(np.searchsorted(order_ids, lines['order_id'].to_numpy()), len(order_ids) - 1)
+        product_pos = _positions(products['product_id'], lines['product_id'])
+        matched = (order_ids[pos] == lines['order_id'].to_numpy()) & (product_pos >= 0)
+        pos, product_pos = pos[matched], product_pos[matched]
+        amount, quantity = lines['total_amount'].to_numpy()[matched].astype(np.float64), lines['quantity'].to_numpy()[matched]
+        cust_pos = buffer['customer_pos'].to_numpy()[pos]
+        category_codes, name_codes = category.codes[product_pos], product_name.codes[product_pos].astype(np.int64)
+
+        # Missing categories, names and personas are code -1; like the in-memory groupbys, leave them out of those breakdowns.
+        has_category, has_name = category_codes >= 0, name_codes >= 0
+        category_revenue += np.bincount(category_codes[has_category], weights=amount[has_category], minlength=len(category_revenue))
+        name_quantity += np.bincount(name_codes[has_name], weights=quantity[has_name], minlength=n_names).astype(np.int64)
+        known = cust_pos >= 0
+        monetary[:] += np.bincount(cust_pos[known], weights=amount[known], minlength=n_customers)
+        persona_codes = np.where(known, persona.codes[cust_pos], -1).astype(np.int64)
+        persona_codes[persona_codes < 0] = len(persona.categories)
+        persona_name_lines += np.bincount(persona_codes[has_name] * n_names + name_codes[has_name], minlength=len(persona_name_lines))
+        month = buffer['day'].to_numpy()[pos].astype('datetime64[D]').astype('datetime64[M]')
+        monthly = monthly.add(pd.Series(amount).groupby(month).sum(), fill_value=0)
+        pending_months.append(customer_month_revenue(cust_pos[known], month[known].astype(np.int64), amount[known]))
+        if sum(len(part) for part in pending_months) > 4 * chunk_size:
+            customer_months = pd.concat([customer_months] + pending_months).groupby(level=0).sum()
+            pending_months.clear()
+        # Keep the last order: its line items may continue in the next chunk.
+        buffer = buffer[buffer['order_id'] >= needed]
+    for chunk in order_chunks:
+        add_orders(chunk)
+    customer_months = pd.concat([customer_months] + pending_months).groupby(level=0).sum()
+
+    ordered = frequency > 0
+    revenue_by_category = pd.Series(category_revenue, index=pd.Index(category.categories, name='category'), name='total_amount')
+    persona_counts = persona_name_lines[:len(persona.categories) * n_names].reshape(len(persona.categories), n_names)
+    monthly.index = pd.PeriodIndex(monthly.index, freq='M').astype(str).rename('Month')
+    return {
+        'rfm_state': pd.DataFrame({'customer_id': customers['customer_id'].to_numpy()[ordered], 'first_order_date': pd.to_datetime(first_day[ordered].astype('datetime64[D]')),
+                                   'last_order_date': pd.to_datetime(last_day[ordered].astype('datetime64[D]')),
+                                   'frequency': frequency[ordered], 'monetary': monetary[ordered]}),
+        'revenue_by_category': revenue_by_category[revenue_by_category > 0].sort_values(ascending=False),
+        'monthly_revenue': monthly.rename('total_amount'),
+        'quantity_by_product_name': pd.DataFrame({'product_name': product_name.categories, 'quantity': name_quantity}).query('quantity > 0'),
+        'orders_by_location': pd.Series(frequency, index=pd.Index(customers['location'].to_numpy(), name='location')).groupby(level=0).sum(),
+        'persona_product_counts': pd.DataFrame({'persona': np.repeat(persona.categories, n_names), 'product_name': np.tile(product_name.categories, len(persona.categories)),
+                                                'n': persona_counts.ravel()}).query('n > 0'),
+        'customer_months': customer_months,
+    }
+
+# Months since 1970 fit in 12 bits until 2311; customer-month keys pack the customer position above them.
+CUSTOMER_MONTH_SPAN = 1 << 12
+
+def customer_month_revenue(customer_pos, month, amount):
+    """Revenue of each active (customer position, month since 1970) pair, keyed by customer_pos * CUSTOMER_MONTH_SPAN + month."""
+    keys, inverse = np.unique(customer_pos.astype(np.int64) * CUSTOMER_MONTH_SPAN + month, return_inverse=True)
+    return pd.Series(np.bincount(inverse, weights=amount, minlength=len(keys)), index=keys)
+
+def _positions(index_values, keys):
+    """Row position of each key in index_values (-1 if absent), hashing only the distinct keys of categorical columns."""
+    index = pd.Index(index_values)
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        return index.get_indexer(keys.cat.categories)[keys.cat.codes.to_numpy()]
+    return index.get_indexer(keys)
+
+def build_sales_fact(customers, products, orders, lineitems, quiet):
+    """Join line items to their order, product and customer once, with categorical codes and int32 ids; unknown orders or products are dropped."""
+    verbose_print("Building sales fact table...", quiet)
+    order_pos = _positions(orders['order_id'], lineitems['order_id'])
+    product_pos = _positions(products['product_id'], lineitems['product_id'])
+    keep = (order_pos >= 0) & (product_pos >= 0)
+    order_pos, product_pos = order_pos[keep], product_pos[keep]
+
+    customer_ids = orders['customer_id'].to_numpy()
+    customer_pos = _positions(customers['customer_id'], orders['customer_id'])[order_pos]
+    category = pd.Categorical(products['category'])
+    product_name = pd.Categorical(products['product_name'])
+    persona = pd.Categorical(customers['persona'])
+
+    def coded(cat, pos):
+        codes = cat.codes[pos]
+        codes[pos < 0] = -1
+        return pd.Categorical.from_codes(codes, cat.categories)
+
+    return pd.DataFrame({
+        'order_id': lineitems['order_id'].to_numpy()[keep],
+        'product_idx': product_pos.astype(np.int32),
+        'product_name': coded(product_name, product_pos),
+        'category': coded(category, product_pos),
+        'customer_id': customer_ids[order_pos].astype(np.int32),
+        'persona': coded(persona, customer_pos),
+        'store_id': orders['store_id'].to_numpy()[order_pos].astype(np.int32),
+        'order_date': orders['order_date'].to_numpy()[order_pos],
+        'quantity': lineitems['quantity'].to_numpy()[keep],
+        'total_amount': lineitems['total_amount'].to_numpy()[keep].astype(np.float64),
+    })
+
+def chart_spec(series, kind, title, figsize, xlabel=None):
+    """Describe a bar ('bar'/'barh') or 'line' chart of `series` as plain data; render_charts() draws it later."""
+    return {'kind': kind, 'title': title, 'figsize': figsize, 'xlabel': xlabel if xlabel is not None else series.index.name,
+            'labels': [str(label) for label in series.index], 'values': [float(v) for v in series.to_numpy()]}
+
+def heatmap_spec(frame, title, figsize, xlabel, ylabel):
+    """Describe a heatmap of a numeric DataFrame (rows top to bottom, NaN cells left blank) as plain data."""
+    return {'kind': 'heatmap', 'title': title, 'figsize': figsize, 'xlabel': xlabel, 'ylabel': ylabel,
+            'labels': [str(label) for label in frame.index], 'columns': [str(column) for column in frame.columns],
+            'values': frame.to_numpy(dtype=float).tolist()}
+
+def render_chart(spec, dpi=160):
+    """Rasterize one chart spec to PNG bytes with the object-oriented API, so workers share no pyplot state."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=spec['figsize'])
+    ax = fig.subplots()
+    positions = range(len(spec['values']))
+    if spec['kind'] == 'heatmap':
+        image = ax.imshow(np.array(spec['values'], dtype=float), aspect='auto', cmap='Blues')
+        row_step, column_step = max(1, len(spec['labels']) // 24), max(1, len(spec['columns']) // 24)
+        ax.set_yticks(positions[::row_step], spec['labels'][::row_step], fontsize=7)
+        ax.set_xticks(range(len(spec['columns']))[::column_step], spec['columns'][::column_step], fontsize=7)
+        ax.set_xlabel(spec['xlabel']); ax.set_ylabel(spec['ylabel'])
+        fig.colorbar(image, ax=ax)
+    elif spec['kind'] == 'barh':
+        ax.barh(positions, spec['values'])
+        ax.set_yticks(positions, spec['labels'])
+        ax.set_ylabel(spec['xlabel'] or "")
+    elif spec['kind'] == 'bar':
+        ax.bar(positions, spec['values'])
+        ax.set_xticks(positions, spec['labels'], rotation=90)
+        ax.set_xlabel(spec['xlabel'] or "")
+    else:
+        ax.plot(positions, spec['values'])
+        step = max(1, len(positions) // 8)
+        ax.set_xticks(positions[::step], spec['labels'][::step])
+        ax.set_xlabel(spec['xlabel'] or "")
+    ax.set_title(spec['title'])
     buf = BytesIO()
-    pltfig.savefig(buf, format="png", bbox_inches="tight", dpi=160)
-    buf.seek(0)
-    plt.close(pltfig)
-    return buf
+    fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi)
+    return buf.getvalue()
+
+def chart_drawing(spec, width=400, height=200):
+    """Build a chart spec as a vector reportlab Drawing, embedded in the PDF without rasterizing."""
+    from reportlab.lib import colors
+    from reportlab.graphics.shapes import Drawing, String, Rect
+    from reportlab.graphics.charts.barcharts import VerticalBarChart, HorizontalBarChart
+    from reportlab.graphics.charts.linecharts import HorizontalLineChart
+    drawing = Drawing(width, height + 20)
+    drawing.add(String(width / 2, height + 6, spec['title'], fontSize=10, textAnchor='middle'))
+    if spec['kind'] == 'heatmap':
+        values = np.array(spec['values'], dtype=float)
+        rows, columns = values.shape
+        left, bottom, plot_width, plot_height = 45, 20, width - 55, height - 30
+        cell_width, cell_height = plot_width / max(columns, 1), plot_height / max(rows, 1)
+        low, high = (np.nanmin(values), np.nanmax(values)) if np.isfinite(values).any() else (0, 0)
+        for r, c in zip(*np.nonzero(np.isfinite(values))):
+            shade = colors.linearlyInterpolatedColor(colors.white, colors.HexColor('#1f77b4'), 0, 1, (values[r, c] - low) / (high - low) if high > low else 1)
+            drawing.add(Rect(left + c * cell_width, bottom + plot_height - (r + 1) * cell_height, cell_width, cell_height, fillColor=shade, strokeColor=None))
+        for r in range(0, rows, max(1, rows // 24)):
+            drawing.add(String(left - 3, bottom + plot_height - (r + 0.7) * cell_height, spec['labels'][r], fontSize=5, textAnchor='end'))
+        for c in range(0, columns, max(1, columns // 24)):
+            drawing.add(String(left + (c + 0.5) * cell_width, bottom - 8, spec['columns'][c], fontSize=5, textAnchor='middle'))
+        drawing.add(String(left + plot_width / 2, 0, spec['xlabel'], fontSize=6, textAnchor='middle'))
+        return drawing
+    if spec['kind'] == 'barh':
+        chart = HorizontalBarChart()
+        chart.x, chart.y, chart.width, chart.height = 110, 20, width - 130, height - 30
+    else:
+        chart = VerticalBarChart() if spec['kind'] == 'bar' else HorizontalLineChart()
+        chart.x, chart.y, chart.width, chart.height = 50, 70, width - 60, height - 80
+        chart.categoryAxis.labels.angle = 45
+        chart.categoryAxis.labels.boxAnchor = 'ne'
+        if spec['kind'] == 'line':
+            step = max(1, len(spec['labels']) // 8)
+            spec = dict(spec, labels=[label if i % step == 0 else "" for i, label in enumerate(spec['labels'])])
+    chart.data = [spec['values']]
+    if spec['kind'] == 'line':
+        chart.lines[0].strokeColor = colors.HexColor('#1f77b4')
+    else:
+        chart.bars[0].fillColor = colors.HexColor('#1f77b4')
+        chart.bars.strokeWidth = 0
+    chart.categoryAxis.categoryNames = spec['labels']
+    chart.categoryAxis.labels.fontSize = 6
+    chart.valueAxis.labels.fontSize = 6
+    chart.valueAxis.valueMin = min(0, min(spec['values'], default=0))
+    drawing.add(chart)
+    return drawing
+
+def _render_cached(job):
+    spec, dpi = job
+    return render_chart(spec, dpi)
+
+def render_charts(specs, args, cache=None):
+    """Render the chart specs to PNGs (cached, on up to args.jobs workers) or vector drawings; returns (images, cache hits)."""
+    if args.charts == 'vector':
+        return [chart_drawing(spec) if spec else None for spec in specs], 0
+    keys = [cache.section_key('chart', {}, {'spec': spec, 'dpi': args.chart_dpi}) if cache and spec else None for spec in specs]
+    pngs = [cache.get(key) if key else None for key in keys]
+    hits = sum(png is not None for png in pngs)
+    todo = [i for i, spec in enumerate(specs) if spec and pngs[i] is None]
+    jobs = [(specs[i], args.chart_dpi) for i in todo]
+    if args.jobs > 1 and len(todo) > 1:
+        context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(todo)), mp_context=context) as pool:
+            rendered = list(pool.map(_render_cached, jobs))
+    else:
+        rendered = [_render_cached(job) for job in jobs]
+    for i, png in zip(todo, rendered):
+        pngs[i] = png
+        if keys[i]:
+            cache.put(keys[i], png)
+    return [BytesIO(png) if png is not None else None for png in pngs], hits
+
+def rfm_aggregates(orders, lines, owners=None):
+    """Per-customer first and last order date and order count of `orders`, and the spend of `lines` on the orders in `owners` (default `orders`)."""
+    state = orders.groupby("customer_id").agg(first_order_date=("order_date", "min"), last_order_date=("order_date", "max"), frequency=("order_id", "size"))
+    owners = orders if owners is None else owners
+    order_pos = _positions(owners["order_id"], lines["order_id"])
+    known = order_pos >= 0
+    spend = pd.Series(lines["total_amount"].to_numpy()[known].astype(np.float64)).groupby(owners["customer_id"].to_numpy()[order_pos[known]]).sum()
+    state = state.join(spend.rename("monetary").rename_axis("customer_id"), how="outer")
+    state["frequency"] = state["frequency"].fillna(0).astype(np.int64)
+    state["monetary"] = state["monetary"].fillna(0.0)
+    return state.reset_index()
+
+def update_rfm_state(state, orders, lines, owners=None):
+    """Fold new orders and line items into the per-customer RFM state; combining costs O(customers)."""
+    new = rfm_aggregates(orders, lines, owners)
+    if state is None or state.empty:
+        return new
+    return pd.concat([state, new]).groupby("customer_id").agg(first_order_date=("first_order_date", "min"), last_order_date=("last_order_date", "max"),
+                                                             frequency=("frequency", "sum"), monetary=("monetary", "sum")).reset_index()
+
+# Bytes kept from the end of a CSV read, to check that the rows before a resume offset are still in place.
+CSV_MARK_BYTES = 256
+
+def read_new_rows(folder, fmt, table, columns, mark=None):
+    """Rows of `table` added since the read that returned `mark`, and the next mark; RuntimeError if read rows were rewritten."""
+    path = table_path(folder, table, fmt)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"File {os.path.basename(path)} missing in {folder}.")
+    if fmt == 'parquet':
+        parts = sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True)) if os.path.isdir(path) else [path]
+        stamps = {os.path.relpath(part, folder): [os.stat(part).st_size, os.stat(part).st_mtime_ns] for part in parts}
+        mark = mark or {}
+        if any(stamps.get(part) != stamp for part, stamp in mark.items()):
+            raise RuntimeError(f"{table} parquet parts were rewritten")
+        new = [os.path.join(folder, part) for part in stamps if part not in mark]
+        df = pd.concat([pd.read_parquet(part, columns=columns) for part in new], ignore_index=True) if new else pd.DataFrame(columns=columns)
+        return conform(df, table), stamps
+    offset, tail = mark if mark is not None else (0, b'')
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(offset - len(tail))
+        if size < offset or f.read(len(tail)) != tail:
+            raise RuntimeError(f"{os.path.basename(path)} was rewritten")
+        data = f.read(size - offset)
+    # A writer may be mid-row; the partial last line is read next time.
+    end = data.rfind(b'\n') + 1
+    source = BytesIO((','.join(TABLE_COLUMNS[table]).encode() + b'\n' if offset else b'') + data[:end])
+    df = conform(pd.read_csv(source, encoding='utf-8-sig', usecols=columns, **read_csv_args(table, columns)), table)
+    tail = (tail + data[:end])[-CSV_MARK_BYTES:]
+    return df, (offset + end, tail)
 
-def customer_analytics(customers, orders, lineitems, quiet):
-    summary, gender_buf, loc_buf, rfm, high_value, at_risk = "", None, None, None, None, None
+def load_rfm_state(path):
+    """The dict saved by save_rfm_state, or None when there is none yet."""
+    return pd.read_pickle(path) if os.path.exists(path) else None
+
+def save_rfm_state(path, saved):
+    # Everything lives in one file replaced atomically, so state, marks and held-back rows can never disagree after a crash.
+    pd.to_pickle(saved, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+def _append_rows(frame, more):
+    return more if frame is None or not len(frame) else frame if not len(more) else pd.concat([frame, more], ignore_index=True)
+
+def refresh_rfm_state(path, folder, fmt, quiet=False):
+    """Fold the orders and line items appended since the last call into the RFM state saved at `path`, and return it."""
+    saved = load_rfm_state(path)
+    if saved is not None and (not isinstance(saved, dict) or saved.get('format') != fmt or 'open_orders' not in saved):
+        verbose_print("  (RFM state predates this version or input format; rebuilding it)", quiet)
+        saved = None
+    order_columns, line_columns = SECTION_COLUMNS['rfm_state']['orders'], ['order_id', 'product_id', 'total_amount']
+    try:
+        marks = saved['marks'] if saved else {}
+        orders, order_mark = read_new_rows(folder, fmt, 'orders', order_columns, marks.get('orders'))
+        lines, line_mark = read_new_rows(folder, fmt, 'lineitems', line_columns, marks.get('lineitems'))
+    except RuntimeError as e:
+        verbose_print(f"  ({e}; rebuilding the RFM state)", quiet)
+        saved = None
+        orders, order_mark = read_new_rows(folder, fmt, 'orders', order_columns)
+        lines, line_mark = read_new_rows(folder, fmt, 'lineitems', line_columns)
+    saved = saved or {'format': fmt, 'state': None, 'last_order_id': 0, 'pending_orders': orders.iloc[:0], 'pending_lines': None,
+                      'open_orders': orders[['order_id', 'customer_id']].iloc[:0]}
+    # Like build_sales_fact, leave out line items of unknown products.
+    products = load_data(folder, True, fmt, {'products': ['product_id']})['products']
+    lines = lines.loc[_positions(products['product_id'], lines['product_id']) >= 0, ['order_id', 'total_amount']]
+    orders, lines = _append_rows(saved['pending_orders'], orders), _append_rows(saved['pending_lines'], lines)
+
+    # As in query_service, an order counts once line items past it were written (syndata.py writes both in order_id
+    # order); later orders are held back. Line items of the newest counted order may still be arriving, so it stays
+    # open, and line items whose order was not read yet wait for it.
+    watermark = int(lines['order_id'].max()) if len(lines) else saved['last_order_id']
+    ready = (orders['order_id'] <= watermark).to_numpy()
+    counted, pending_orders = orders[ready], orders[~ready]
+    owners = _append_rows(saved['open_orders'], counted[['order_id', 'customer_id']])
+    last_order_id = max(saved['last_order_id'], int(counted['order_id'].max()) if len(counted) else 0)
+    pending_lines = lines[(_positions(owners['order_id'], lines['order_id']) < 0) & (lines['order_id'] > last_order_id).to_numpy()]
+    verbose_print(f"  (RFM state: folding in {len(counted)} new orders)", quiet)
+    state = update_rfm_state(saved['state'], counted, lines, owners)
+    save_rfm_state(path, {'format': fmt, 'state': state, 'last_order_id': last_order_id, 'marks': {'orders': order_mark, 'lineitems': line_mark},
+                          'pending_orders': pending_orders, 'pending_lines': pending_lines,
+                          'open_orders': owners[owners['order_id'] == last_order_id]})
+    return state
+
+def safe_qcut(series, q=4, reverse=False):
+    try:
+        labels = list(range(1, q + 1))
+        if reverse: labels = labels[::-1]
+        return pd.qcut(series, q, labels=labels, duplicates='drop')
+    except ValueError:
+        return pd.Series([1] * len(series), index=series.index)
+
+def score_rfm(state):
+    """Recency/Frequency/Monetary quartile scores from the compact per-customer state."""
+    rfm = pd.DataFrame({
+        "customer_id": state["customer_id"],
+        "Recency": (state["last_order_date"].max() - state["last_order_date"]).dt.days,
+        "Frequency": state["frequency"],
+        "Monetary": state["monetary"],
+    })
+    rfm["R_Quartile"] = safe_qcut(rfm["Recency"], reverse=True)
+    rfm["F_Quartile"] = safe_qcut(rfm["Frequency"])
+    rfm["M_Quartile"] = safe_qcut(rfm["Monetary"])
+    rfm["RFM_Score"] = rfm["R_Quartile"].astype(str) + rfm["F_Quartile"].astype(str) + rfm["M_Quartile"].astype(str)
+    return rfm
+
+def customer_analytics(customers, orders, fact, quiet, aggregates=None, state=None):
+    """Demographic charts and RFM segments, from `state` or `aggregates` when given, else from orders and fact."""
+    summary, gender_chart, loc_chart, rfm, high_value, at_risk = "", None, None, None, None, None
     try:
         verbose_print("Customer Analytics: Demographics, RFM...", quiet)
-        recent_dates = orders.groupby("customer_id")["order_date"].max().reset_index()
-        recent_dates["Recency"] = (pd.to_datetime(orders["order_date"].max()) - pd.to_datetime(recent_dates["order_date"])).dt.days
-        freq = orders.groupby("customer_id").size().reset_index(name="Frequency")
-        lineitems_orders = pd.merge(lineitems, orders[["order_id", "customer_id"]], on="order_id")
-        monetary = lineitems_orders.groupby("customer_id")["total_amount"].sum().reset_index(name="Monetary")
-        rfm = pd.merge(pd.merge(recent_dates[["customer_id", "Recency"]], freq, on="customer_id"), monetary, on="customer_id")
-
-        def safe_qcut(series, q=4, reverse=False):
-            try:
-                labels = list(range(1, q + 1))
-                if reverse: labels = labels[::-1]
-                return pd.qcut(series, q, labels=labels, duplicates='drop')
-            except ValueError:
-                return pd.Series([1] * len(series), index=series.index)
-
-        rfm["R_Quartile"] = safe_qcut(rfm["Recency"], reverse=True)
-        rfm["F_Quartile"] = safe_qcut(rfm["Frequency"])
-        rfm["M_Quartile"] = safe_qcut(rfm["Monetary"])
-        rfm["RFM_Score"] = rfm["R_Quartile"].astype(str) + rfm["F_Quartile"].astype(str) + rfm["M_Quartile"].astype(str)
+        if aggregates is not None:
+            state = aggregates["rfm_state"]
+        elif state is None:
+            state = rfm_aggregates(orders, fact)
+        rfm = score_rfm(state)
         high_value = rfm[rfm["RFM_Score"] == '444']
         at_risk = rfm[rfm["R_Quartile"] == 1]
 
-        plt1 = plt.figure(figsize=(6, 4)); customers['gender'].value_counts().plot(kind='barh'); plt.title("Customer Gender Distribution"); gender_buf = plot_to_buf(plt1)
-        plt2 = plt.figure(figsize=(6, 4)); customers['location'].value_counts().head(10).plot(kind='bar'); plt.title("Top 10 Customer Locations"); loc_buf = plot_to_buf(plt2)
+        gender_chart = chart_spec(customers['gender'].value_counts(), 'barh', "Customer Gender Distribution", (6, 4))
+        loc_chart = chart_spec(customers['location'].value_counts().head(10), 'bar', "Top 10 Customer Locations", (6, 4))
         summary = f"RFM segmentation identifies {len(high_value)} high-value and {len(at_risk)} at-risk customers."
     except Exception as e:
         summary = exception_message("Customer Analytics", e)
-    return rfm, high_value, at_risk, gender_buf, loc_buf, summary
+    return rfm, high_value, at_risk, gender_chart, loc_chart, summary
 
-def sales_conversion_analysis(orders, lineitems, products, quiet):
-    cat_buf, sales_trend_buf, rev_by_cat, monthly_sales, summary = None, None, None, None, ""
+def cohort_analysis(customers, fact, quiet, state=None, aggregates=None, by='first-order'):
+    """Acquisition-month x months-since retention and revenue matrices, by first order month or (by='join') join month."""
+    chart, retention, revenue, summary = None, None, None, ""
+    try:
+        verbose_print("Cohort Analysis...", quiet)
+        if aggregates is not None:
+            activity, state = aggregates['customer_months'], aggregates['rfm_state']
+        else:
+            customer_pos = _positions(customers['customer_id'], fact['customer_id'])
+            known = customer_pos >= 0
+            month = fact['order_date'].to_numpy()[known].astype('datetime64[M]').astype(np.int64)
+            activity = customer_month_revenue(customer_pos[known], month, fact['total_amount'].to_numpy()[known])
+        if activity.empty:
+            return None, None, None, "No orders for cohort analysis."
+        customer_pos, month = np.divmod(activity.index.to_numpy(), CUSTOMER_MONTH_SPAN)
+
+        none = np.iinfo(np.int64).max
+        cohort = np.full(len(customers), none)
+        if by == 'join':
+            joined = customers['join_date'].notna().to_numpy()
+            cohort[joined] = customers['join_date'].to_numpy()[joined].astype('datetime64[M]').astype(np.int64)
+        elif state is not None:
+            pos = _positions(customers['customer_id'], state['customer_id'])
+            cohort[pos[pos >= 0]] = state['first_order_date'].to_numpy()[pos >= 0].astype('datetime64[M]').astype(np.int64)
+        else:
+            np.minimum.at(cohort, customer_pos, month)
+
+        last = month.max()
+        members = cohort[cohort <= last]
+        first = members.min()
+        n = int(last - first + 1)
+        offset = month - cohort[customer_pos]
+        valid = (cohort[customer_pos] <= last) & (offset >= 0)
+        cells = (cohort[customer_pos][valid] - first) * n + offset[valid]
+        active = np.bincount(cells, minlength=n * n).reshape(n, n)
+        spend = np.bincount(cells, weights=activity.to_numpy()[valid], minlength=n * n).reshape(n, n)
+        sizes = np.bincount(members - first, minlength=n)
+
+        observed = np.arange(n)[None, :] <= (n - 1 - np.arange(n))[:, None]
+        labels = pd.Index(np.arange(first, last + 1).astype('datetime64[M]').astype(str), name='cohort')
+        keep = sizes > 0
+        retention = pd.DataFrame(np.where(observed, 100 * active / np.maximum(sizes, 1)[:, None], np.nan).round(1), index=labels)[keep]
+        revenue = pd.DataFrame(np.where(observed, spend, np.nan).round(2), index=labels)[keep]
+        retention.insert(0, 'customers', sizes[keep])
+        chart = heatmap_spec(retention.drop(columns='customers'), "Cohort Retention (% of customers ordering)", (10, 5),
+                             "Months since acquisition", "Acquisition month")
+
+        second = observed[:, 1] & keep if n > 1 else np.zeros(n, dtype=bool)
+        returning = 100 * active[second, 1].sum() / max(sizes[second].sum(), 1)
+        summary = (f"{int(keep.sum())} monthly cohorts by {'join' if by == 'join' else 'first order'} month. "
+                   f"On average {returning:.1f}% of a cohort orders again in its second month.")
+    except Exception as e:
+        summary = exception_message("Cohort Analysis", e)
+    return retention, revenue, chart, summary
+
+def sales_conversion_analysis(fact, quiet, aggregates=None):
+    cat_chart, sales_trend_chart, rev_by_cat, monthly_sales, summary = None, None, None, None, ""
     try:
         verbose_print("Sales and Conversion Analysis...", quiet)
-        merged = pd.merge(lineitems, products, on="product_id")
-        merged_orders = pd.merge(orders, merged, on="order_id")
-        rev_by_cat = merged_orders.groupby("category")["total_amount"].sum().sort_values(ascending=False)
-        plt1 = plt.figure(figsize=(10, 4)); rev_by_cat.plot(kind='bar'); plt.title("Revenue by Product Category"); cat_buf = plot_to_buf(plt1)
-        merged_orders['Month'] = pd.to_datetime(merged_orders['order_date']).dt.to_period('M').astype(str)
-        monthly_sales = merged_orders.groupby("Month")["total_amount"].sum()
-        plt2 = plt.figure(figsize=(10, 4)); monthly_sales.plot(); plt.title("Monthly Revenue Trend"); plt.xlabel("Month"); sales_trend_buf = plot_to_buf(plt2)
+        if aggregates is not None:
+            rev_by_cat, monthly_sales = aggregates["revenue_by_category"], aggregates["monthly_revenue"]
+        else:
+            rev_by_cat = fact.groupby("category", observed=True)["total_amount"].sum().sort_values(ascending=False)
+            monthly_sales = fact.groupby(fact['order_date'].dt.to_period('M'))["total_amount"].sum()
+            monthly_sales.index = monthly_sales.index.astype(str).rename("Month")
+        cat_chart = chart_spec(rev_by_cat, 'bar', "Revenue by Product Category", (10, 4))
+        sales_trend_chart = chart_spec(monthly_sales, 'line', "Monthly Revenue Trend", (10, 4), xlabel="Month")
         summary = "Revenue by product category and monthly trends shown."
     except Exception as e:
         summary = exception_message("Sales Conversion Analysis", e)
-    return rev_by_cat, monthly_sales, cat_buf, sales_trend_buf, summary
+    return rev_by_cat, monthly_sales, cat_chart, sales_trend_chart, summary
 
-def product_performance(lineitems, products, quiet):
-    top_buf, bot_buf, top_10, bottom_10, summary = None, None, None, None, ""
+def product_performance(fact, quiet, aggregates=None):
+    top_chart, bot_chart, top_10, bottom_10, summary = None, None, None, None, ""
     try:
         verbose_print("Product Performance...", quiet)
         
-        merged_df = pd.merge(lineitems, products, on="product_id")
-        
-        prod_sales_by_name = merged_df.groupby("product_name")["quantity"].sum().reset_index()
+        if aggregates is not None:
+            prod_sales_by_name = aggregates["quantity_by_product_name"]
+        else:
+            prod_sales_by_name = fact.groupby("product_name", observed=True)["quantity"].sum().reset_index()
 
-        top_10 = prod_sales_by_name.sort_values("quantity", ascending=False).head(10)
-        bottom_10 = prod_sales_by_name.sort_values("quantity", ascending=True).head(10)
+        # Stable sort with the name as tie-breaker, so in-memory and --chunk-size runs list tied products alike.
+        by_name = lambda column: column.astype(str) if column.name == "product_name" else column
+        top_10 = prod_sales_by_name.sort_values(["quantity", "product_name"], ascending=[False, True], kind="mergesort", key=by_name).head(10).reset_index(drop=True)
+        bottom_10 = prod_sales_by_name.sort_values(["quantity", "product_name"], ascending=[True, True], kind="mergesort", key=by_name).head(10).reset_index(drop=True)
         
-        plt1 = plt.figure(figsize=(10, 4)); top_10.set_index("product_name")["quantity"].plot(kind='bar'); plt.title("Top 10 Bestselling Products"); top_buf = plot_to_buf(plt1)
-        plt2 = plt.figure(figsize=(10, 4)); bottom_10.set_index("product_name")["quantity"].plot(kind='bar'); plt.title("Bottom 10 Products"); bot_buf = plot_to_buf(plt2)
+        top_chart = chart_spec(top_10.set_index("product_name")["quantity"], 'bar', "Top 10 Bestselling Products", (10, 4))
+        bot_chart = chart_spec(bottom_10.set_index("product_name")["quantity"], 'bar', "Bottom 10 Products", (10, 4))
         summary = "Top 10 bestsellers and bottom 10 slow movers visualized, aggregated by product name."
     except Exception as e:
         summary = exception_message("Product Performance", e)
-    return top_10, bottom_10, top_buf, bot_buf, summary
+    return top_10, bottom_10, top_chart, bot_chart, summary
 
-def market_basket_analysis(lineitems, products, quiet):
-    mba_buf, rules, summary = None, None, ""
+def market_basket_analysis(fact, products, quiet, min_support=0.0005, chunk_orders=250_000):
+    """Association rules for frequent product pairs, counted as X.T @ X over a sparse order x product matrix in blocks of orders."""
+    mba_chart, rules, summary = None, None, ""
     try:
         verbose_print("Market Basket Analysis...", quiet)
+        from scipy import sparse
 
-        all_order_ids = lineitems['order_id'].unique()
-        sample_size = min(50000, len(all_order_ids))
-        
-        if sample_size > 1:
-            sampled_order_ids = random.sample(list(all_order_ids), sample_size)
-            sampled_lineitems = lineitems[lineitems['order_id'].isin(sampled_order_ids)]
-        else:
+        order_codes, order_ids = pd.factorize(fact['order_id'])
+        n_orders = len(order_ids)
+        if n_orders < 2:
             return None, None, "Not enough data for Market Basket Analysis."
 
-        verbose_print(f"  (Analyzing a sample of {sample_size} orders)", quiet)
-        
-        basket = sampled_lineitems.groupby(['order_id', 'product_id'])['quantity'].sum().unstack(fill_value=0)
-        basket_sets = basket.map(lambda x: 1 if x > 0 else 0)
-        
-        frequent_itemsets = fpgrowth(basket_sets, min_support=0.0005, use_colnames=True)
-        
-        if not frequent_itemsets.empty:
-            rules_df = association_rules(frequent_itemsets, metric="confidence", min_threshold=0)
-            
-            rules = rules_df.sort_values("confidence", ascending=False)
-            
-            if not rules.empty:
-                product_names = products.set_index('product_id')['product_name']
-                rules['antecedents'] = rules['antecedents'].apply(lambda x: ', '.join([product_names.get(i, i) for i in x]))
-                rules['consequents'] = rules['consequents'].apply(lambda x: ', '.join([product_names.get(i, i) for i in x]))
-                summary = "Frequent product bundles and association rules found from a data sample."
-            else:
-                summary = "No association rules found."
+        baskets = sparse.csr_matrix((np.ones(len(fact), dtype=np.int32), (order_codes, fact['product_idx'].to_numpy())), shape=(n_orders, len(products)))
+        baskets.sum_duplicates()
+        baskets.data[:] = 1
+        min_count = int(np.ceil(min_support * n_orders))
+        item_counts = np.asarray(baskets.sum(axis=0)).ravel()
+        frequent = np.flatnonzero(item_counts >= min_count)
+        baskets = baskets[:, frequent]
+        verbose_print(f"  ({n_orders} orders, {len(frequent)} frequent products)", quiet)
+
+        pair_counts = sparse.csr_matrix((len(frequent), len(frequent)), dtype=np.int64)
+        for start in range(0, n_orders, chunk_orders):
+            block = baskets[start:start + chunk_orders]
+            pair_counts = pair_counts + (block.T @ block).astype(np.int64)
+        pairs = sparse.triu(pair_counts, k=1).tocoo()
+        keep = pairs.data >= min_count
+
+        if keep.any():
+            a, b, both = frequent[pairs.row[keep]], frequent[pairs.col[keep]], pairs.data[keep]
+            ante, cons, both = np.concatenate([a, b]), np.concatenate([b, a]), np.concatenate([both, both])
+            product_names = products['product_name'].to_numpy()
+            rules = pd.DataFrame({
+                'antecedents': product_names[ante],
+                'consequents': product_names[cons],
+                'antecedent support': item_counts[ante] / n_orders,
+                'consequent support': item_counts[cons] / n_orders,
+                'support': both / n_orders,
+                'confidence': both / item_counts[ante],
+            })
+            rules['lift'] = rules['confidence'] / rules['consequent support']
+            rules = rules.sort_values(['confidence', 'support', 'antecedents', 'consequents'], ascending=[False, False, True, True], kind='mergesort').reset_index(drop=True)
+            summary = f"{len(rules)} association rules mined from frequent product pairs across all {n_orders} orders."
         else:
             summary = "No frequent product bundles found for current settings."
     except Exception as e:
         summary = exception_message("Market Basket Analysis", e)
-    return rules, mba_buf, summary
+    return rules, mba_chart, summary
 
-# --- CHANGE 1: THIS ENTIRE FUNCTION HAS BEEN REPLACED ---
-def customer_personalization(customers, products, lineitems, orders, quiet):
+def customer_personalization(fact, quiet, aggregates=None):
     recommendations, summary = {}, ""
     try:
         verbose_print("Customer Personalization...", quiet)
-        if customers is None:
+        if aggregates is not None:
+            counts = aggregates['persona_product_counts']
+        elif fact['persona'].isna().all():
             return {}, "Customer data missing for personalization."
+        else:
+            counts = fact.groupby(['persona', 'product_name'], observed=True).size().reset_index(name='n')
 
-        # Merge dataframes to link lineitems to personas and product names
-        merged_df = pd.merge(lineitems, orders, on='order_id')
-        merged_df = pd.merge(merged_df, customers, on='customer_id')
-        merged_df = pd.merge(merged_df, products, on='product_id')
-
-        recommendations = {}
-        # Find the most frequently ordered product for each persona
-        for persona in merged_df['persona'].unique():
-            # .mode()[0] is an efficient way to find the most frequent item
-            top_product = merged_df[merged_df['persona'] == persona]['product_name'].mode()[0]
-            recommendations[persona] = top_product
+        # Most frequently ordered product for each persona (ties go to the first name, like .mode()[0])
+        top = counts.sort_values(['persona', 'n', 'product_name'], ascending=[True, False, True]).drop_duplicates('persona')
+        recommendations = dict(zip(top['persona'].astype(str), top['product_name'].astype(str)))
 
         summary = "Generated top product recommendation for each customer persona."
     except Exception as e:
         summary = exception_message("Customer Personalization", e)
     return recommendations, summary
-# --- END OF CHANGE 1 ---
 
-def fraud_detection(orders, lineitems, quiet):
+RECOMMENDATION_BLOCK_CELLS = 1 << 21
+DENSE_SIMILARITY_CELLS = 1 << 25
+
+def recommend_products(fact, customers, products, quiet, top_n=10):
+    """Top-N products each customer has not bought yet, scored by item-item cosine similarity in blocks of customers."""
+    recommendations, summary = None, ""
+    try:
+        verbose_print("Product Recommendations...", quiet)
+        from scipy import sparse
+        n_customers, n_products = len(customers), len(products)
+        rows = _positions(customers['customer_id'], fact['customer_id'])
+        known = rows >= 0
+        purchases = sparse.csr_matrix((np.ones(int(known.sum()), dtype=np.float32), (rows[known], fact['product_idx'].to_numpy()[known])),
+                                      shape=(n_customers, n_products))
+        purchases.sum_duplicates()
+        purchases.data[:] = 1
+        buyers = np.asarray(purchases.sum(axis=0)).ravel()
+        scale = sparse.diags((1 / np.sqrt(np.maximum(buyers, 1))).astype(np.float32))
+        similarity = (scale @ (purchases.T @ purchases) @ scale).tocsr()
+        similarity.setdiag(0)
+        similarity.eliminate_zeros()
+        pairs = similarity.nnz
+        if n_products * n_products <= DENSE_SIMILARITY_CELLS:
+            similarity = similarity.toarray()
+        popularity = (buyers / max(buyers.max(), 1) * 1e-6).astype(np.float32)
+
+        top_n = min(top_n, n_products)
+        block_size = max(1, RECOMMENDATION_BLOCK_CELLS // max(n_products, 1))
+        top_products = np.empty((n_customers, top_n), dtype=np.int64)
+        top_scores = np.empty((n_customers, top_n), dtype=np.float32)
+        for start in range(0, n_customers, block_size):
+            block = purchases[start:start + block_size]
+            scores = block @ similarity
+            scores = (scores.toarray() if sparse.issparse(scores) else scores) + popularity
+            scores[block.nonzero()] = -np.inf
+            top = np.argpartition(scores, -top_n, axis=1)[:, -top_n:] if top_n < n_products else np.tile(np.arange(n_products), (len(scores), 1))
+            best = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-best, axis=1, kind='stable')
+            top_products[start:start + block_size] = np.take_along_axis(top, order, axis=1)
+            top_scores[start:start + block_size] = np.take_along_axis(best, order, axis=1)
+
+        valid = np.isfinite(top_scores).ravel()
+        product_idx = top_products.ravel()[valid]
+        recommendations = pd.DataFrame({
+            'customer_id': np.repeat(customers['customer_id'].to_numpy(), top_n)[valid],
+            'rank': np.tile(np.arange(1, top_n + 1, dtype=np.int16), n_customers)[valid],
+            'product_id': products['product_id'].to_numpy()[product_idx],
+            'product_name': products['product_name'].to_numpy()[product_idx],
+            'score': top_scores.ravel()[valid].round(6),
+        })
+        summary = (f"Scored {n_customers} customers against {n_products} products ({pairs} similar product pairs); "
+                   f"up to {top_n} unpurchased products recommended per customer.")
+    except Exception as e:
+        summary = exception_message("Product Recommendations", e)
+    return recommendations, summary
+
+FRAUD_FEATURES = ['order_amount', 'item_count', 'total_quantity', 'unit_price_deviation', 'customer_amount_deviation', 'hour_of_day', 'payment_method_share']
+
+def build_fraud_features(fact, orders):
+    """One row of FRAUD_FEATURES per order, indexed by order_id."""
+    unit_price = fact['total_amount'] / fact['quantity']
+    price_deviation = np.abs(np.log(unit_price / unit_price.groupby(fact['product_idx']).transform('median')))
+    features = pd.DataFrame({'order_id': fact['order_id'], 'customer_id': fact['customer_id'], 'total_amount': fact['total_amount'],
+                             'quantity': fact['quantity'], 'price_deviation': price_deviation}).groupby('order_id').agg(
+        customer_id=('customer_id', 'first'), order_amount=('total_amount', 'sum'), item_count=('total_amount', 'size'),
+        total_quantity=('quantity', 'sum'), unit_price_deviation=('price_deviation', 'max'))
+    log_amount = np.log1p(features['order_amount'])
+    features['customer_amount_deviation'] = log_amount - log_amount.groupby(features['customer_id']).transform('mean')
+
+    order_pos = _positions(orders['order_id'], features.index)
+    features['hour_of_day'] = (orders['order_time'] // pd.Timedelta(hours=1)).to_numpy()[order_pos]
+    pay_codes, _ = pd.factorize(orders['payment_method'])
+    features['payment_method_share'] = (np.bincount(pay_codes) / len(pay_codes))[pay_codes][order_pos]
+    return features
+
+def load_or_train_fraud_model(features, model_path=None, retrain=False, n_jobs=None, quiet=False):
+    """Return (model, trained) - the persisted IsolationForest when usable, otherwise a freshly fitted (and saved) one."""
+    import joblib
+    from sklearn.ensemble import IsolationForest
+    if model_path and os.path.exists(model_path) and not retrain:
+        bundle = joblib.load(model_path)
+        if bundle['features'] == FRAUD_FEATURES:
+            bundle['model'].set_params(n_jobs=n_jobs)
+            return bundle['model'], False
+        verbose_print("  (Saved fraud model uses different features; retraining)", quiet)
+    model = IsolationForest(contamination=0.01, random_state=42, n_jobs=n_jobs)
+    model.fit(features[FRAUD_FEATURES].to_numpy())
+    if model_path:
+        joblib.dump({'model': model, 'features': FRAUD_FEATURES, 'trained_orders': len(features)}, model_path + ".tmp")
+        os.replace(model_path + ".tmp", model_path)
+    return model, True
+
+def fraud_detection(fact, orders, quiet, model_path=None, retrain=False, n_jobs=None, since=None):
+    """Score orders with an IsolationForest, trained once per model_path; `since` limits scoring to orders on or after that date."""
     fraud_orders, summary = None, ""
     try:
         verbose_print("Fraud Detection (Anomaly Detection)...", quiet)
-        agg = lineitems.groupby('order_id')['quantity'].sum().reset_index()
-        features = agg[['quantity']]
-        model = IsolationForest(contamination=0.01, random_state=42)
-        agg['anomaly'] = model.fit_predict(features)
-        fraud_orders = agg[agg['anomaly'] == -1]
-        summary = f"{len(fraud_orders)} potentially fraudulent orders detected."
+        features = build_fraud_features(fact, orders)
+        model, trained = load_or_train_fraud_model(features, model_path, retrain, n_jobs, quiet)
+        if since:
+            order_dates = fact.groupby('order_id')['order_date'].first().reindex(features.index)
+            features = features[order_dates >= pd.Timestamp(since)]
+        X = features[FRAUD_FEATURES].to_numpy()
+        features['anomaly'] = model.predict(X)
+        features['anomaly_score'] = model.score_samples(X)
+        fraud_orders = features[features['anomaly'] == -1].sort_values('anomaly_score').reset_index()
+        # Said here rather than in the summary, which the report cache replays on later runs.
+        verbose_print(f"  (Fraud model {'trained' if trained else 'loaded from ' + model_path}{' and saved to ' + model_path if trained and model_path else ''})", quiet)
+        summary = f"{len(fraud_orders)} potentially fraudulent orders detected among {len(features)} scored orders."
     except Exception as e:
         summary = exception_message("Fraud Detection", e)
     return fraud_orders, summary
 
-def geo_demo_analysis(customers, orders, quiet):
-    geo_buf, sales_by_loc, summary = None, None, ""
+def geo_demo_analysis(customers, orders, quiet, aggregates=None):
+    geo_chart, sales_by_loc, summary = None, None, ""
     try:
         verbose_print("Geo/Demographic Analysis...", quiet)
-        merged = orders.merge(customers[['customer_id', 'location']], on='customer_id')
-        sales_by_loc = merged.groupby('location').size().sort_values(ascending=False).head(10)
-        plt1 = plt.figure(figsize=(10, 5)); sales_by_loc.plot(kind="barh"); plt.title("Order Volume by City"); geo_buf = plot_to_buf(plt1)
+        if aggregates is not None:
+            sales_by_loc = aggregates['orders_by_location']
+        else:
+            sales_by_loc = orders.merge(customers[['customer_id', 'location']], on='customer_id').groupby('location', observed=True).size()
+        sales_by_loc = sales_by_loc.sort_values(ascending=False).head(10)
+        geo_chart = chart_spec(sales_by_loc, 'barh', "Order Volume by City", (10, 5))
         summary = "Top 10 high-volume sales cities highlighted."
     except Exception as e:
         summary = exception_message("Geo/Demographic Analysis", e)
-    return sales_by_loc, geo_buf, summary
+    return sales_by_loc, geo_chart, summary
+
+# Report sections, in PDF order. Each runner takes the shared tables and the parsed arguments and returns
+# (console label, summary text, chart spec for the PDF, [(console table title, table)], {output file name: DataFrame}).
+# The output files are written to the data folder by main(), also when the section comes from the cache.
+def _section_customers(data, args):
+    rfm, high_value, at_risk, gender_chart, loc_chart, summary = customer_analytics(data['customers'], data.get('orders'), data.get('fact'), args.quiet,
+                                                                                    data.get('aggregates'), data.get('rfm_state'))
+    return "Customer Analytics", summary, gender_chart, [("High Value Customers (Sample)", high_value), ("At Risk Customers (Sample)", at_risk)], {}
+
+def _section_cohort(data, args):
+    retention, revenue, chart, summary = cohort_analysis(data['customers'], data.get('fact'), args.quiet, data.get('rfm_state'), data.get('aggregates'), args.cohort_by)
+    return "Cohort Analysis", summary, chart, [("Cohort Retention % (rows: acquisition month, columns: months since)", retention), ("Cohort Revenue", revenue)], {}
+
+def _section_sales(data, args):
+    rev_by_cat, monthly_sales, cat_chart, st_chart, summary = sales_conversion_analysis(data.get('fact'), args.quiet, data.get('aggregates'))
+    return "Sales Conversion", summary, cat_chart, [("Revenue by Product Category", rev_by_cat), ("Monthly Sales", monthly_sales)], {}
+
+def _section_products(data, args):
+    top_10, bottom_10, top_chart, bot_chart, summary = product_performance(data.get('fact'), args.quiet, data.get('aggregates'))
+    return "Product Performance", summary, top_chart, [("Top 10 Products", top_10), ("Bottom 10 Products", bottom_10)], {}
+
+OUT_OF_CORE_SKIPPED = "Skipped: needs the full line-item table, which is not loaded in out-of-core mode (--chunk-size)."
+
+def _section_basket(data, args):
+    if 'fact' not in data:
+        return "Market Basket Analysis", OUT_OF_CORE_SKIPPED, None, [], {}
+    rules, mba_chart, summary = market_basket_analysis(data['fact'], data['products'], args.quiet)
+    return "Market Basket Analysis", summary, mba_chart, [("Association Rules (top 5)", rules)], {}
+
+def _section_personalization(data, args):
+    recomm, summary = customer_personalization(data.get('fact'), args.quiet, data.get('aggregates'))
+    tables = [("Recommendations by Segment", pd.DataFrame(list(recomm.items()), columns=["Segment", "Top Product"]))]
+    if args.top_n <= 0:
+        return "Personalization", summary, None, tables, {}
+    if 'fact' not in data:
+        return "Personalization", f"{summary} Per-customer recommendations: {OUT_OF_CORE_SKIPPED}", None, tables, {}
+    recommendations, rec_summary = recommend_products(data['fact'], data['customers'], data['products'], args.quiet, args.top_n)
+    rec_chart, files = None, {}
+    if recommendations is not None:
+        files["recommendations.csv"] = recommendations
+        rec_summary += " Written to recommendations.csv."
+        top_pick = recommendations[recommendations['rank'] == 1]['product_name'].value_counts().head(10)
+        rec_chart = chart_spec(top_pick.iloc[::-1], 'barh', "Most Frequent #1 Recommendations (customers)", (10, 5))
+        tables += [("Most Frequent #1 Recommendations", top_pick.rename_axis("Product").reset_index(name="Customers")),
+                   ("Sample Customer Recommendations", recommendations[recommendations['rank'] <= 3].head(9)[['customer_id', 'rank', 'product_name', 'score']].reset_index(drop=True))]
+    return "Personalization", f"{summary} {rec_summary}", rec_chart, tables, files
+
+def _section_fraud(data, args):
+    if 'fact' not in data:
+        return "Fraud Detection", OUT_OF_CORE_SKIPPED, None, [], {}
+    frauds, summary = fraud_detection(data['fact'], data['orders'], args.quiet, args.fraud_model, args.retrain_fraud, args.n_jobs, args.fraud_since)
+    return "Fraud Detection", summary, None, [("Fraudulent Transactions (Sample)", frauds)], {}
+
+def _section_geo(data, args):
+    sales_by_loc, geo_chart, summary = geo_demo_analysis(data['customers'], data.get('orders'), args.quiet, data.get('aggregates'))
+    return "Geo/Demographic", summary, geo_chart, [("Top Cities by Order Volume", sales_by_loc)], {}
+
+REPORT_SECTIONS = [
+    ('customers', "Customer Demographics & Segmentation", _section_customers),
+    ('cohort', "Cohort Retention", _section_cohort),
+    ('sales', "Sales Trends & Categories", _section_sales),
+    ('products', "Product Performance", _section_products),
+    ('basket', "Market Basket Analysis", _section_basket),
+    ('personalization', "Customer Personalization/Recommendation", _section_personalization),
+    ('fraud', "Fraud/Anomaly Detection", _section_fraud),
+    ('geo', "Geo/Demographic Breakdown", _section_geo),
+]
+
+# SECTION_COLUMNS entries each report section reads, so --sections only loads what it needs.
+SECTION_ANALYSES = {
+    'customers': ('rfm_state', 'customer_analytics'),
+    'cohort': ('build_sales_fact', 'rfm_state', 'cohort_analysis'),
+    'sales': ('build_sales_fact', 'sales_conversion_analysis'),
+    'products': ('build_sales_fact', 'product_performance'),
+    'basket': ('build_sales_fact', 'market_basket_analysis'),
+    'personalization': ('build_sales_fact', 'customer_personalization', 'recommend_products'),
+    'fraud': ('build_sales_fact', 'fraud_detection'),
+    'geo': ('geo_demo_analysis',),
+}
+
+# Input tables and arguments that determine each section's result, for the report cache key. Arguments naming
+# a file in CACHE_FILE_ARGS also key on the file's content.
+SECTION_CACHE_INPUTS = {
+    'customers': (('customers', 'products', 'orders', 'lineitems'), ()),
+    'cohort': (('customers', 'products', 'orders', 'lineitems'), ('cohort_by',)),
+    'sales': (('customers', 'products', 'orders', 'lineitems'), ()),
+    'products': (('customers', 'products', 'orders', 'lineitems'), ()),
+    'basket': (('customers', 'products', 'orders', 'lineitems'), ()),
+    'personalization': (('customers', 'products', 'orders', 'lineitems'), ('top_n',)),
+    'fraud': (('customers', 'products', 'orders', 'lineitems'), ('fraud_model', 'fraud_since')),
+    'geo': (('customers', 'orders'), ()),
+}
+CACHE_FILE_ARGS = {'fraud_model'}
+
+def source_hash(directory):
+    """Hash of the Python sources in `directory`: ecomm.py and the modules it imports from there (schema.py, ...)."""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode() + hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+class ReportCache:
+    """On-disk cache of section results keyed by input content, options and code, evicting least recently used entries beyond max_bytes."""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hash_index_path = os.path.join(cache_dir, "file_hashes.json")
+        self.hash_index = {}
+        if os.path.exists(self.hash_index_path):
+            with open(self.hash_index_path) as f:
+                self.hash_index = json.load(f)
+        self.code_version = source_hash(os.path.dirname(os.path.abspath(__file__)))
+
+    def _file_hash(self, path):
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        known = self.hash_index.get(path)
+        if known and known[0] == stamp:
+            return known[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.hash_index[path] = [stamp, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def table_hash(self, folder, table, fmt):
+        path = os.path.abspath(table_path(folder, table, fmt))
+        if not os.path.isdir(path):
+            return self._file_hash(path)
+        digest = hashlib.sha256()
+        for root, dirs, files in sorted(os.walk(path)):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                digest.update(os.path.relpath(full, path).encode() + self._file_hash(full).encode())
+        return digest.hexdigest()
+
+    def section_key(self, section, table_hashes, params):
+        payload = json.dumps({'section': section, 'inputs': table_hashes, 'params': params, 'code': self.code_version}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.cache_dir, f"{key}.pkl")
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # mark as recently used
+        return pd.read_pickle(path)
+
+    def put(self, key, result):
+        path = os.path.join(self.cache_dir, f"{key}.pkl")
+        pd.to_pickle(result, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self._evict()
+
+    def _evict(self):
+        entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith('.pkl')]
+        total = sum(e.stat().st_size for e in entries)
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def save_hash_index(self):
+        with open(self.hash_index_path + ".tmp", 'w') as f:
+            json.dump(self.hash_index, f)
+        os.replace(self.hash_index_path + ".tmp", self.hash_index_path)
+
+def section_cache_keys(cache, args):
+    """Cache key of every selected report section for the current inputs and arguments."""
+    table_hashes, keys = {}, {}
+    for key in args.sections:
+        tables, arg_names = SECTION_CACHE_INPUTS[key]
+        for t in tables:
+            if t not in table_hashes:
+                table_hashes[t] = cache.table_hash(args.datafolder, t, args.format)
+        params = {name: getattr(args, name) for name in arg_names}
+        for name in CACHE_FILE_ARGS.intersection(arg_names):
+            path = getattr(args, name)
+            params[f"{name}_content"] = cache._file_hash(os.path.abspath(path)) if path and os.path.exists(path) else None
+        params['out_of_core'] = bool(args.chunk_size)
+        keys[key] = cache.section_key(key, {t: table_hashes[t] for t in tables}, params)
+    cache.save_hash_index()
+    return keys
+
+_SECTION_INPUT = None
+
+def _section_error(index, e):
+    """Section result reporting `e`, for a section that raised or whose worker process died."""
+    key, title, _ = REPORT_SECTIONS[index]
+    return title, exception_message(f"Section {key}", e), None, [], {}
+
+def _run_section(index):
+    """Run one section under stage(); returns (result, timing record, whether it reported an error) so forked workers can hand back their timings."""
+    data, args = _SECTION_INPUT
+    errors = _ERROR_COUNT
+    key, _, runner = REPORT_SECTIONS[index]
+    metrics = []
+    rows_in = len(data['fact']) if 'fact' in data else len(data['customers'])
+    with stage(f"section:{key}", metrics, args, rows_in) as record:
+        try:
+            result = runner(data, args)
+        except Exception as e:
+            result = _section_error(index, e)
+        record['rows_out'] = sum(len(table) for _, table in result[3] if hasattr(table, '__len__'))
+    return result, metrics[0], _ERROR_COUNT > errors
+
+def _section_outcome(index, future):
+    try:
+        return future.result()
+    except Exception as e:
+        # The worker died (e.g. killed for memory); the pool is broken, so sections still queued on it fail here too.
+        record = {'stage': f"section:{REPORT_SECTIONS[index][0]}", 'rows_in': None, 'rows_out': None, 'cache': None}
+        return _section_error(index, e), record, True
+
+def run_sections(data, args, indices=None):
+    """Run the sections at `indices` (default all), forked onto up to args.jobs workers; returns (result, timing, failed) in order."""
+    global _SECTION_INPUT
+    _SECTION_INPUT = (data, args)
+    indices = range(len(REPORT_SECTIONS)) if indices is None else indices
+    if args.jobs > 1 and len(indices) > 1 and 'fork' in mp.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(indices)), mp_context=mp.get_context('fork')) as pool:
+            futures = [pool.submit(_run_section, i) for i in indices]
+            return [_section_outcome(i, future) for i, future in zip(indices, futures)]
+    if args.jobs > 1 and len(indices) > 1:
+        verbose_print("[WARN] Process forking is not available on this platform; running sections one after another.", args.quiet)
+    return [_run_section(i) for i in indices]
 
 def write_pdf(report_name, summaries, images, quiet):
     verbose_print("Generating PDF report...", quiet)
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, PageBreak
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.graphics.shapes import Drawing
     styles = getSampleStyleSheet()
     doc = SimpleDocTemplate(report_name, pagesize=letter)
     Story = []
     while len(images) < len(summaries['titles']):
         images.append(None)
-    for title, text, img_buf in zip(summaries['titles'], summaries['texts'], images):
+    for title, text, image in zip(summaries['titles'], summaries['texts'], images):
         Story.append(Paragraph(title, styles['Heading2']))
         Story.append(Spacer(1, 8))
         Story.append(Paragraph(text.replace('\n', '<br/>'), styles['Normal']))
         Story.append(Spacer(1, 16))
-        if img_buf:
-            Story.append(Image(img_buf, width=400, height=200))
+        if isinstance(image, Drawing):
+            Story.append(image)
+        elif image:
+            Story.append(Image(image, width=400, height=200))
         Story.append(PageBreak())
     doc.build(Story)
 
+def _as_frame(table):
+    return table.to_frame(name=table.name if table.name is not None else 'value') if isinstance(table, pd.Series) else table
+
+def table_records(table):
+    """A section table (DataFrame or Series) as a list of JSON-ready row dicts, keeping a meaningful index as columns."""
+    frame = _as_frame(table)
+    frame = frame.reset_index(drop=isinstance(frame.index, pd.RangeIndex))
+    return json.loads(frame.to_json(orient='records', date_format='iso'))
+
+def write_tables(folder, fmt, sections):
+    """Write the (key, title, result) sections as report.json, or as report_tables/ with summary.csv and one CSV per table."""
+    if fmt == 'json':
+        report = [{'section': key, 'title': title, 'summary': result[1],
+                   'tables': {name: table_records(table) for name, table in result[3] if isinstance(table, (pd.DataFrame, pd.Series))}}
+                  for key, title, result in sections]
+        with open(os.path.join(folder, "report.json"), 'w') as f:
+            json.dump(report, f, indent=2)
+        return "report.json"
+    out = os.path.join(folder, "report_tables")
+    os.makedirs(out, exist_ok=True)
+    pd.DataFrame([(key, title, result[1]) for key, title, result in sections], columns=['section', 'title', 'summary']).to_csv(os.path.join(out, "summary.csv"), index=False)
+    for key, _, result in sections:
+        for name, table in result[3]:
+            if isinstance(table, (pd.DataFrame, pd.Series)):
+                slug = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+                _as_frame(table).to_csv(
+                    os.path.join(out, f"{key}__{slug}.csv"), index=not isinstance(table.index, pd.RangeIndex))
+    return "report_tables/"
+
+def write_section_files(folder, results):
+    """Write the output files of the given section results (e.g. recommendations.csv) to `folder`; returns the rows written."""
+    rows = 0
+    for result in results:
+        for name, frame in result[4].items():
+            frame.to_csv(os.path.join(folder, name), index=False)
+            rows += len(frame)
+    return rows
+
 def print_table(title, df, max_rows=5):
     print(f"\n{'='*20}\n{title}")
     if df is not None and not isinstance(df,str) and not df.empty:
@@ -243,58 +1172,136 @@ def print_table(title, df, max_rows=5):
 def main():
     args = parse_args()
     verbose_print(f"Ecommerce Analytics by {AUTHOR}", args.quiet)
-    report_texts, images = [], []
+    report_texts, charts = [], []
+    cache, cache_keys, results = None, {}, {}
+    metrics, hit_metrics = [], []
+    selected = [section for section in REPORT_SECTIONS if section[0] in args.sections]
+    if not args.no_cache:
+        try:
+            with stage("cache_lookup", metrics, args, len(selected)) as record:
+                cache = ReportCache(args.cache_dir or os.path.join(args.datafolder, ".ecomm_cache"), args.cache_max_mb * 1024 * 1024)
+                cache_keys = section_cache_keys(cache, args)
+                for key, _, _ in selected:
+                    if not (key == 'fraud' and args.retrain_fraud):
+                        t0 = time.perf_counter()
+                        hit = cache.get(cache_keys[key])
+                        if hit is not None:
+                            results[key] = hit
+                            hit_metrics.append({'stage': f"section:{key}", 'wall_s': round(time.perf_counter() - t0, 4),
+                                            'rows_out': sum(len(table) for _, table in hit[3] if hasattr(table, '__len__')), 'cache': 'hit'})
+                record['rows_out'] = len(results)
+            metrics.extend(hit_metrics)
+            verbose_print(f"Report cache: {len(results)} of {len(selected)} sections unchanged", args.quiet)
+        except Exception as e:
+            print(exception_message("Report Cache", e)); cache = None
+
+    pending = [i for i, (key, _, _) in enumerate(REPORT_SECTIONS) if key in args.sections and key not in results]
+    # Only what the sections still to run need is loaded; cached sections cost nothing beyond the lookup.
+    analyses = {analysis for i in pending for analysis in SECTION_ANALYSES[REPORT_SECTIONS[i][0]]}
+    if 'rfm_state' in analyses and not args.rfm_state:
+        # Without --rfm-state the RFM state is aggregated from the loaded orders and sales fact; with it, only new rows are read.
+        analyses.add('build_sales_fact')
+    rfm_state = None
+    if args.rfm_state and any('rfm_state' in SECTION_ANALYSES[key] for key in args.sections):
+        # Refreshed even when the sections reading it are cached, so the saved state keeps up with the data; it only reads new rows.
+        try:
+            with stage("rfm_state", metrics, args) as record:
+                rfm_state = refresh_rfm_state(args.rfm_state, args.datafolder, args.format, args.quiet)
+                record['rows_out'] = len(rfm_state)
+        except Exception as e:
+            verbose_print(exception_message("RFM State", e), args.quiet)
+    if pending:
+        try:
+            with stage("load_data", metrics, args) as record:
+                if args.chunk_size:
+                    dfs = load_data(args.datafolder, args.quiet, args.format, {'customers': TABLE_COLUMNS['customers'], 'products': TABLE_COLUMNS['products']})
+                    data = {'customers': dfs['customers'], 'products': dfs['products'],
+                            'aggregates': streaming_aggregates(args.datafolder, args.format, dfs['customers'], dfs['products'], args.chunk_size, args.quiet)}
+                else:
+                    dfs = load_data(args.datafolder, args.quiet, args.format, required_columns(analyses - {'rfm_state'} if args.rfm_state else analyses))
+                record['rows_out'] = sum(len(df) for df in dfs.values())
+            if not args.chunk_size and 'build_sales_fact' in analyses:
+                with stage("build_sales_fact", metrics, args, len(dfs['lineitems'])) as record:
+                    fact = build_sales_fact(dfs['customers'], dfs['products'], dfs['orders'], dfs['lineitems'], args.quiet)
+                    record['rows_out'] = len(fact)
+                data = {'customers': dfs['customers'], 'orders': dfs['orders'], 'products': dfs['products'], 'fact': fact}
+                del dfs
+            elif not args.chunk_size:
+                data = dfs
+            if rfm_state is not None:
+                data['rfm_state'] = rfm_state
+            elif not args.chunk_size and not args.rfm_state and 'rfm_state' in analyses:
+                # Computed once here and shared by the customer and cohort sections; if it fails, they report it.
+                try:
+                    with stage("rfm_state", metrics, args, len(data['orders'])) as record:
+                        data['rfm_state'] = rfm_aggregates(data['orders'], data['fact'])
+                        record['rows_out'] = len(data['rfm_state'])
+                except Exception as e:
+                    verbose_print(exception_message("RFM State", e), args.quiet)
+        except Exception as e:
+            print(exception_message("Load Data", e)); write_timings(args.datafolder, metrics); sys.exit(1)
+
+        outputs = run_sections(data, args, pending)
+        if cache is not None and args.fraud_model and 'fraud' in args.sections:
+            # Training may have just written --fraud-model; key the results on the model they were scored with.
+            try:
+                cache_keys = section_cache_keys(cache, args)
+            except Exception as e:
+                print(exception_message("Report Cache", e)); cache = None
+        for i, (result, record, failed) in zip(pending, outputs):
+            key = REPORT_SECTIONS[i][0]
+            results[key] = result
+            record['cache'] = 'miss' if cache is not None else None
+            metrics.append(record)
+            # Sections report failures as text rather than raising; never cache those.
+            if cache is not None and not failed:
+                cache.put(cache_keys[key], result)
+
+    for key, _, _ in selected:
+        label, summary, chart, tables, _ = results[key]
+        print(f"\n[{label}]:", summary)
+        for table_title, table in tables:
+            print_table(table_title, table)
+        report_texts.append(summary); charts.append(chart)
+    if any(results[key][4] for key, _, _ in selected):
+        try:
+            with stage("write_files", metrics, args, len(selected)) as record:
+                record['rows_out'] = write_section_files(args.datafolder, [results[key] for key, _, _ in selected])
+        except Exception as e:
+            print(exception_message("Section Output Files", e))
+    report_titles = [title for _, title, _ in selected]
+
+    if args.output_format != 'pdf':
+        try:
+            with stage(f"write_{args.output_format}", metrics, args, len(selected)):
+                output = write_tables(args.datafolder, args.output_format, [(key, title, results[key]) for key, title, _ in selected])
+            print(f"\n[INFO] Analysis Complete. Output: {output}")
+        except Exception as e:
+            print(exception_message("Table Output", e))
+            write_timings(args.datafolder, metrics)
+            sys.exit(2)
+        write_timings(args.datafolder, metrics)
+        return
+
     try:
-        dfs = load_data(args.datafolder, args.quiet)
+        with stage("chart_rendering", metrics, args, sum(chart is not None for chart in charts)) as record:
+            images, hits = render_charts(charts, args, cache)
+            record['rows_out'] = sum(image is not None for image in images)
+            record['cache'] = f"{hits} hit" if cache is not None and args.charts == 'png' else None
     except Exception as e:
-        print(exception_message("Load Data", e)); sys.exit(1)
-
-    # Customer Analytics
-    rfm, high_value, at_risk, gender_buf, loc_buf, ca_summary = customer_analytics(dfs['customers'], dfs['orders'], dfs['lineitems'], args.quiet)
-    print("\n[Customer Analytics]:", ca_summary); print_table("High Value Customers (Sample)", high_value); print_table("At Risk Customers (Sample)", at_risk)
-    report_texts.append(ca_summary); images.append(gender_buf)
-
-    # Sales Conversion Analysis
-    rev_by_cat, monthly_sales, cat_buf, st_buf, sca_summary = sales_conversion_analysis(dfs['orders'], dfs['lineitems'], dfs['products'], args.quiet)
-    print("\n[Sales Conversion]:", sca_summary); print_table("Revenue by Product Category", rev_by_cat); print_table("Monthly Sales", monthly_sales)
-    report_texts.append(sca_summary); images.append(cat_buf)
-
-    # Product Performance
-    top_10, bottom_10, top_buf, bot_buf, pp_summary = product_performance(dfs['lineitems'], dfs['products'], args.quiet)
-    print("\n[Product Performance]:", pp_summary); print_table("Top 10 Products", top_10); print_table("Bottom 10 Products", bottom_10)
-    report_texts.append(pp_summary); images.append(top_buf)
-
-    # Market Basket Analysis
-    rules, mba_buf, mba_summary = market_basket_analysis(dfs['lineitems'], dfs['products'], args.quiet)
-    print("\n[Market Basket Analysis]:", mba_summary); print_table("Association Rules (top 5)", rules)
-    report_texts.append(mba_summary); images.append(mba_buf)
-
-    # --- CHANGE 2: THE FUNCTION CALL IS UPDATED ---
-    # Personalization
-    recomm, pers_summary = customer_personalization(dfs['customers'], dfs['products'], dfs['lineitems'], dfs['orders'], args.quiet)
-    print("\n[Personalization]:", pers_summary); print_table("Recommendations by Segment", pd.DataFrame(list(recomm.items()), columns=["Segment", "Top Product"]))
-    report_texts.append(pers_summary); images.append(None)
-    # --- END OF CHANGE 2 ---
-
-    # Fraud detection
-    frauds, fraud_summary = fraud_detection(dfs['orders'], dfs['lineitems'], args.quiet)
-    print("\n[Fraud Detection]:", fraud_summary); print_table("Fraudulent Transactions (Sample)", frauds)
-    report_texts.append(fraud_summary); images.append(None)
-
-    # Geo demo analysis
-    sales_by_loc, geo_buf, geo_summary = geo_demo_analysis(dfs['customers'], dfs['orders'], args.quiet)
-    print("\n[Geo/Demographic]:", geo_summary); print_table("Top Cities by Order Volume", sales_by_loc)
-    report_texts.append(geo_summary); images.append(geo_buf)
-
-    report_titles = ["Customer Demographics & Segmentation", "Sales Trends & Categories", "Product Performance", "Market Basket Analysis", "Customer Personalization/Recommendation", "Fraud/Anomaly Detection", "Geo/Demographic Breakdown"]
+        print(exception_message("Chart Rendering", e))
+        images = [None] * len(charts)
 
     try:
-        write_pdf(os.path.join(args.datafolder, "report.pdf"), {'titles': report_titles, 'texts': report_texts}, images, args.quiet)
+        with stage("write_pdf", metrics, args, len(report_texts)):
+            write_pdf(os.path.join(args.datafolder, "report.pdf"), {'titles': report_titles, 'texts': report_texts}, images, args.quiet)
         print("\n[INFO] Analysis Complete. Output file: report.pdf")
     except Exception as e:
         print(exception_message("PDF Generation", e))
+        write_timings(args.datafolder, metrics)
         sys.exit(2)
+    write_timings(args.datafolder, metrics)
+    verbose_print("[INFO] Stage timings: report_timings.json, report_timings.csv", args.quiet)
 
 if __name__ == '__main__':
     main()
-    
\ No newline at end of file
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+query_service.py: Local HTTP/JSON service answering filtered revenue / order count / AOV queries in milliseconds.
+
+Loads the syndata.py tables once and keeps two in-memory views: an append-only ledger with one row per order
+(day, store, customer city, persona, payment method, set of categories bought, revenue per category) and a
+monthly rollup over city x persona x payment method. Queries read whole months from the rollup and only the
+days at the edges of the range from the ledger, finding filtered rows through per-dimension position indexes.
+Appended rows are picked up on refresh without rereading what was already loaded.
+
+    python query_service.py --datafolder ./data --port 8765 --refresh-seconds 300
+    curl 'http://127.0.0.1:8765/kpi?from=2023-01-01&to=2023-03-31&city=Delhi,Mumbai&category=Electronics&group_by=month'
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from schema import CATEGORIES, CITIES, PERSONAS, PAYMENT_METHODS, read_csv_args, conform
+from ecomm import TABLE_COLUMNS, table_path, _positions, verbose_print, exception_message
+
+ORDER_COLUMNS = ['order_id', 'customer_id', 'store_id', 'order_date', 'payment_method']
+LINE_COLUMNS = ['order_id', 'product_id', 'total_amount']
+LEDGER_DIMENSIONS = ['day', 'store_id', 'city', 'persona', 'payment_method', 'category_mask']
+# Store and the category set are close to unique per order, so the rollup leaves them to the ledger.
+ROLLUP_DIMENSIONS = ['month', 'city', 'persona', 'payment_method']
+# Query parameter -> coded dimension it filters. category is matched against category_mask instead.
+FILTERS = {'store': 'store_id', 'city': 'city', 'persona': 'persona', 'payment_method': 'payment_method'}
+INDEXED = list(FILTERS.values())
+GROUPS = ['day', 'month', 'store', 'city', 'persona', 'payment_method', 'category']
+
+def month_of(day):
+    return int(np.datetime64(int(day), 'D').astype('datetime64[M]').astype(np.int64))
+
+def first_day_of(month):
+    return int(np.datetime64(int(month), 'M').astype('datetime64[D]').astype(np.int64))
+
+class Vocabulary:
+    """Stable integer codes for the labels of one dimension: the shared schema list first, new labels appended."""
+
+    def __init__(self, labels):
+        self.labels = list(labels)
+        self.index = pd.Index(self.labels)
+
+    def codes(self, values):
+        values = values.astype(object) if isinstance(values.dtype, pd.CategoricalDtype) else values
+        new = pd.Index(values.dropna().unique()).difference(self.index)
+        if len(new):
+            self.labels += sorted(new)
+            self.index = pd.Index(self.labels)
+        return self.index.get_indexer(values)
+
+class Postings:
+    """Ascending row positions per code of one dimension, append-only with spare capacity like the Ledger columns,
+    so a snapshot's views stay valid while later rows are appended."""
+
+    def __init__(self):
+        self.arrays, self.lengths = {}, {}
+
+    def add(self, code, positions):
+        n, values = self.lengths.get(code, 0), self.arrays.get(code)
+        if values is None or n + len(positions) > len(values):
+            grown = np.empty(max(2 * (n + len(positions)), 64), dtype=np.int64)
+            if values is not None:
+                grown[:n] = values[:n]
+            self.arrays[code] = values = grown
+        values[n:n + len(positions)] = positions
+        self.lengths[code] = n + len(positions)
+
+    def append(self, codes, start=0):
+        """Index `codes`, the values of rows start, start + 1, ... of the dimension."""
+        order = np.argsort(codes, kind='stable')
+        keys, bounds = np.unique(codes[order], return_index=True)
+        for key, positions in zip(keys, np.split(order + start, bounds[1:])):
+            self.add(int(key), positions)
+
+    def snapshot(self):
+        return {code: values[:self.lengths[code]] for code, values in self.arrays.items()}
+
+def select_rows(lo, hi, filters, index, columns, category_bits=0):
+    """Positions in [lo, hi) matching every filter (and category_bits, through index['category'] and the category mask).
+
+    The filter with the fewest rows in range gives the candidates from its index; the others are checked on just those rows.
+    """
+    if category_bits:
+        filters = {**filters, 'category': [c for c in range(63) if category_bits >> c & 1]}
+    if not filters:
+        return slice(lo, hi)
+    spans = {}
+    for dimension, codes in filters.items():
+        postings = [index[dimension][int(code)] for code in codes if int(code) in index[dimension]]
+        spans[dimension] = [(p, *np.searchsorted(p, [lo, hi])) for p in postings]
+    best = min(spans, key=lambda d: sum(end - start for _, start, end in spans[d]))
+    rows = np.sort(np.concatenate([p[start:end] for p, start, end in spans[best]] + [np.empty(0, dtype=np.int64)]))
+    for dimension, codes in filters.items():
+        if dimension == best:
+            continue
+        if dimension == 'category':
+            rows = rows[(columns['category_mask'][rows] & category_bits) != 0]
+        else:
+            rows = rows[np.isin(columns[dimension][rows], codes)]
+    return rows
+
+class Ledger:
+    """Append-only order rows, sorted by day, as NumPy columns with spare capacity.
+
+    A late line item does not edit its order's row: a -1 row cancels it and a +1 row re-adds the order.
+    Rows below the current length are therefore never written again, and a Cube can keep views of them
+    while later refreshes append. Growing past the capacity copies into new arrays.
+    """
+
+    def __init__(self):
+        self.columns, self.revenue, self.rows = None, None, 0
+        self.index = {d: Postings() for d in INDEXED + ['category']}
+
+    def append(self, frame, n_categories):
+        n = len(frame)
+        if not n:
+            return
+        if self.rows and frame['day'].iloc[0] < self.columns['day'][self.rows - 1]:
+            raise RuntimeError("orders arrived out of date order; reload")
+        if self.columns is None or self.rows + n > len(self.revenue) or n_categories > self.revenue.shape[1]:
+            capacity = max(2 * (self.rows + n), 1024)
+            columns = {d: np.zeros(capacity, dtype=np.int64) for d in LEDGER_DIMENSIONS + ['orders']}
+            revenue = np.zeros((capacity, n_categories))
+            if self.columns is not None:
+                for d, values in columns.items():
+                    values[:self.rows] = self.columns[d][:self.rows]
+                revenue[:self.rows, :self.revenue.shape[1]] = self.revenue[:self.rows]
+            self.columns, self.revenue = columns, revenue
+        for d, values in self.columns.items():
+            values[self.rows:self.rows + n] = frame[d].to_numpy()
+        self.revenue[self.rows:self.rows + n, :n_categories] = frame[[f"revenue_{c}" for c in range(n_categories)]].to_numpy()
+        for d in INDEXED:
+            self.index[d].append(frame[d].to_numpy(), self.rows)
+        mask = frame['category_mask'].to_numpy()
+        for c in range(n_categories):
+            bought = np.flatnonzero(mask >> c & 1)
+            if len(bought):
+                self.index['category'].add(c, self.rows + bought)
+        self.rows += n
+
+class Cube:
+    """Immutable snapshot for queries, so they never see a half-applied refresh or reload: the ledger's first rows,
+    the monthly rollup, their position indexes and the vocabularies that decode them."""
+
+    def __init__(self, ledger, rollup, n_categories, stores, vocab):
+        self.rows = ledger.rows
+        self.ledger = {d: values[:ledger.rows] for d, values in ledger.columns.items()}
+        self.ledger_revenue = ledger.revenue[:ledger.rows, :n_categories]
+        self.ledger_index = {d: postings.snapshot() for d, postings in ledger.index.items()}
+        self.monthly = {d: rollup[d].to_numpy() for d in ROLLUP_DIMENSIONS + ['orders']}
+        self.monthly_revenue = rollup[[f"revenue_{c}" for c in range(n_categories)]].to_numpy()
+        self.monthly_category_orders = rollup[[f"orders_{c}" for c in range(n_categories)]].to_numpy()
+        self.monthly_index = {}
+        for d in ROLLUP_DIMENSIONS[1:]:
+            postings = Postings()
+            postings.append(self.monthly[d])
+            self.monthly_index[d] = postings.snapshot()
+        self.stores = stores
+        self.vocab = {name: Vocabulary(v.labels) for name, v in vocab.items()}
+
+    def ledger_rows(self, first_day, last_day, filters, category_bits):
+        """Positions (or a slice) of the ledger rows in the date range matching the filters."""
+        lo, hi = np.searchsorted(self.ledger['day'], [first_day, last_day + 1])
+        return select_rows(lo, hi, filters, self.ledger_index, self.ledger, category_bits)
+
+    def monthly_rows(self, first_month, last_month, filters):
+        lo, hi = np.searchsorted(self.monthly['month'], [first_month, last_month + 1])
+        return select_rows(lo, hi, filters, self.monthly_index, self.monthly)
+
+class QueryEngine:
+    """Holds the ledger, the rollup and the incremental-load bookkeeping; refresh() folds in rows appended since the last call."""
+
+    def __init__(self, folder, fmt, quiet=False):
+        self.folder, self.fmt, self.quiet = folder, fmt, quiet
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything loaded; called under self.lock (or before the engine is shared). Queries keep using the
+        vocabularies of the Cube they read until the next one is published."""
+        self.vocab = {'city': Vocabulary(CITIES), 'persona': Vocabulary(PERSONAS), 'payment_method': Vocabulary(PAYMENT_METHODS),
+                      'category': Vocabulary(CATEGORIES)}
+        self.offsets, self.seen_files, self.dimension_stamps = {}, {}, {}
+        self.pending_orders = self.pending_lines = None
+        self.recent = None
+        self.last_order_id = 0
+        self.ledger = Ledger()
+        self.rollup = None
+        self.stores = set()
+        self.cube = None
+        self.customers = self.products = None
+
+    # --- loading -------------------------------------------------------------------------------------------------
+
+    def _stamp(self, path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def _load_dimensions(self):
+        """(Re)read customers and products when their files changed; they are small next to the fact tables."""
+        for table, columns in (('customers', ['customer_id', 'location', 'persona']), ('products', ['product_id', 'category'])):
+            path = table_path(self.folder, table, self.fmt)
+            stamp = self._stamp(path)
+            if self.dimension_stamps.get(table) == stamp:
+                continue
+            df = pd.read_parquet(path, columns=columns) if self.fmt == 'parquet' else pd.read_csv(path, usecols=columns, **read_csv_args(table, columns))
+            setattr(self, table, conform(df, table))
+            self.dimension_stamps[table] = stamp
+
+    def _read_csv_tail(self, table, columns):
+        """Rows appended to <table>.csv since the last read, up to the last complete line; None when nothing is new."""
+        path = table_path(self.folder, table, 'csv')
+        offset = self.offsets.get(table, 0)
+        size = os.path.getsize(path)
+        if size < offset:
+            raise RuntimeError(f"{os.path.basename(path)} shrank; reload")
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(size - offset)
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return None
+        header = {} if offset == 0 else {'header': None, 'names': TABLE_COLUMNS[table]}
+        df = pd.read_csv(BytesIO(data[:end]), encoding='utf-8-sig', usecols=columns, **header, **read_csv_args(table, columns))
+        self.offsets[table] = offset + end
+        return conform(df, table)
+
+    def _read_parquet_new(self, table, columns):
+        """Part files of a partitioned Parquet table not read before; a rewritten or deleted part forces a reload."""
+        root = table_path(self.folder, table, 'parquet')
+        files = sorted(glob.glob(os.path.join(root, '**', '*.parquet'), recursive=True)) if os.path.isdir(root) else [root]
+        seen = self.seen_files.setdefault(table, {})
+        stamps = {path: self._stamp(path) for path in files}
+        if any(path not in stamps or stamps[path] != stamp for path, stamp in seen.items()):
+            raise RuntimeError(f"{table} parquet parts were rewritten; reload")
+        new = [path for path in files if path not in seen]
+        if not new:
+            return None
+        df = pd.concat([pd.read_parquet(path, columns=columns) for path in new], ignore_index=True)
+        seen.update({path: stamps[path] for path in new})
+        return conform(df, table)
+
+    def _read_new(self, table, columns):
+        return self._read_parquet_new(table, columns) if self.fmt == 'parquet' else self._read_csv_tail(table, columns)
+
+    def refresh(self):
+        """Fold rows appended since the last refresh into the cube; returns the number of new orders.
+
+        Orders are taken up to the highest order_id seen in the line items, so an order is only counted once
+        its line items have been written (syndata.py writes both in order_id order). Later orders and their
+        line items wait for the next refresh. Files that shrank or were rewritten trigger a full reload.
+        """
+        with self.lock:
+            try:
+                return self._refresh()
+            except RuntimeError as e:
+                verbose_print(f"[INFO] {e}: rebuilding the cube from scratch", self.quiet)
+                self.reset()
+                return self._refresh()
+
+    def _refresh(self):
+        t0 = time.perf_counter()
+        self._load_dimensions()
+        orders = concat_rows(self.pending_orders, self._read_new('orders', ORDER_COLUMNS))
+        lines = concat_rows(self.pending_lines, self._read_new('lineitems', LINE_COLUMNS))
+        if lines is None or orders is None:
+            self.pending_orders, self.pending_lines = orders, lines
+            return 0
+        watermark = int(lines['order_id'].max())
+        ready = (orders['order_id'] <= watermark).to_numpy()
+        self.pending_orders, new_orders = orders[~ready], orders[ready]
+        delta, self.pending_lines = self._order_delta(new_orders, lines)
+        if delta is None:
+            return 0
+
+        n_categories = len(self.vocab['category'].labels)
+        delta = delta.sort_values('day', kind='stable')
+        self.ledger.append(delta, n_categories)
+        self._update_rollup(delta, n_categories)
+        self.stores.update(delta['store_id'].unique().tolist())
+        self.cube = Cube(self.ledger, self.rollup, n_categories, tuple(sorted(self.stores)), self.vocab)
+        if len(new_orders):
+            self.last_order_id = max(self.last_order_id, int(new_orders['order_id'].max()))
+        verbose_print(f"[INFO] Loaded {len(new_orders)} orders / {len(lines) - len(self.pending_lines)} line items; ledger has "
+                      f"{self.cube.rows} rows, monthly rollup {len(self.rollup)} ({(time.perf_counter() - t0) * 1000:.0f} ms)", self.quiet)
+        return len(new_orders)
+
+    def _update_rollup(self, delta, n_categories):
+        """Add the ledger rows in `delta` to the monthly rollup, regrouping only the months from the earliest one they touch."""
+        bought = (delta['category_mask'].to_numpy()[:, None] >> np.arange(n_categories)) & 1
+        rows = delta[ROLLUP_DIMENSIONS[1:] + ['orders'] + [f"revenue_{c}" for c in range(n_categories)]].assign(
+            month=delta['day'].to_numpy().astype('datetime64[D]').astype('datetime64[M]').astype(np.int64),
+            **{f"orders_{c}": bought[:, c] * delta['orders'].to_numpy() for c in range(n_categories)})
+        if self.rollup is None:
+            settled, touched = None, rows
+        else:
+            first = rows['month'].min()
+            changed = (self.rollup['month'] >= first).to_numpy()
+            settled, touched = self.rollup[~changed], pd.concat([self.rollup[changed], rows], ignore_index=True).fillna(0)
+        touched = touched.groupby(ROLLUP_DIMENSIONS, as_index=False).sum()
+        touched = touched[(touched.drop(columns=ROLLUP_DIMENSIONS) != 0).any(axis=1)]
+        self.rollup = concat_rows(settled, touched).fillna(0)
+
+    def _order_rows(self, orders, n_categories):
+        """One coded row per order: its dimensions, an empty category mask, orders = 1 and zero revenue."""
+        customer_pos = _positions(self.customers['customer_id'], orders['customer_id'])
+        found = customer_pos >= 0
+        rows = pd.DataFrame({
+            'order_id': orders['order_id'].to_numpy(),
+            'day': orders['order_date'].to_numpy().astype('datetime64[D]').astype(np.int64),
+            'store_id': orders['store_id'].to_numpy().astype(np.int64),
+            'city': np.where(found, self.vocab['city'].codes(self.customers['location'])[customer_pos], -1),
+            'persona': np.where(found, self.vocab['persona'].codes(self.customers['persona'])[customer_pos], -1),
+            'payment_method': self.vocab['payment_method'].codes(orders['payment_method']),
+            'category_mask': 0, 'orders': 1,
+        })
+        for c in range(n_categories):
+            rows[f"revenue_{c}"] = 0.0
+        return rows
+
+    def _order_delta(self, orders, lines):
+        """Ledger rows adding `orders` and `lines`, and the line items whose order has not been read yet.
+
+        A CSV tail can end in the middle of the newest order's line items. The rest of them reopen that order:
+        its old ledger row is cancelled and the order re-added with the completed category mask and revenue,
+        so category-filtered order counts stay exact.
+        """
+        category_codes = self.vocab['category'].codes(self.products['category'])
+        n_categories = len(self.vocab['category'].labels)
+        if n_categories > 63:
+            raise ValueError("query_service supports at most 63 product categories")
+        revenue_columns = [f"revenue_{c}" for c in range(n_categories)]
+        known = concat_rows(self.recent, self._order_rows(orders, n_categories)).fillna(0.0).reset_index(drop=True)
+        n_recent = 0 if self.recent is None else len(self.recent)
+
+        order_pos = _positions(known['order_id'], lines['order_id'])
+        waiting = (order_pos < 0) & (lines['order_id'] > self.last_order_id).to_numpy()
+        dropped = (order_pos < 0) & ~waiting
+        if dropped.any():
+            verbose_print(f"[WARN] Skipping {int(dropped.sum())} line items whose order was already complete", self.quiet)
+        product_pos = _positions(self.products['product_id'], lines['product_id'])
+        use = (order_pos >= 0) & (product_pos >= 0)
+        if not use.any() and orders.empty:
+            return None, lines[waiting]
+
+        cells = order_pos[use] * n_categories + category_codes[product_pos[use]]
+        size = len(known) * n_categories
+        revenue = np.bincount(cells, weights=lines['total_amount'].to_numpy()[use].astype(np.float64), minlength=size).reshape(-1, n_categories)
+        bought = np.bincount(cells, minlength=size).reshape(-1, n_categories) > 0
+        updated = known.copy()
+        updated[revenue_columns] = known[revenue_columns].to_numpy() + revenue
+        updated['category_mask'] = known['category_mask'].to_numpy() | (bought * (1 << np.arange(n_categories, dtype=np.int64))).sum(axis=1)
+
+        reopened = np.zeros(len(known), dtype=bool)
+        reopened[:n_recent] = bought[:n_recent].any(axis=1)
+        removed = known[reopened].copy()
+        removed['orders'] = -1
+        removed[revenue_columns] = -removed[revenue_columns]
+        changed = reopened.copy()
+        changed[n_recent:] = True
+        delta = pd.concat([removed, updated[changed]], ignore_index=True)
+        newest = updated[n_recent:] if len(orders) else updated[:n_recent]
+        self.recent = newest[newest['order_id'] == newest['order_id'].max()]
+        return delta.drop(columns='order_id'), lines[waiting]
+
+    def _codes(self, vocabs, name, text):
+        values = [v.strip() for v in text.split(',') if v.strip()]
+        if name == 'store':
+            return np.array([int(v) for v in values], dtype=np.int64)
+        vocab = vocabs[name]
+        codes = vocab.index.get_indexer(values)
+        if (codes < 0).any():
+            raise ValueError(f"unknown {name} {', '.join(v for v, c in zip(values, codes) if c < 0)}; choose from {', '.join(vocab.labels)}")
+        return codes
+
+    def kpi(self, params):
+        """Revenue, order count and AOV for the filtered slice, optionally broken down by one group_by dimension.
+
+        With a category filter, revenue counts only line items of those categories and orders are the orders
+        containing at least one of them. Months wholly inside the range are read from the monthly rollup
+        unless the query needs the store or the full category set of each order (a store filter or
+        grouping, group_by=day, several filtered categories); the remaining days come from the ledger.
+        """
+        cube = self.cube
+        if cube is None or not cube.rows:
+            return {'revenue': 0.0, 'orders': 0, 'aov': None, 'groups': []}
+        group_by = params.get('group_by')
+        if group_by and group_by not in GROUPS:
+            raise ValueError(f"unknown group_by {group_by}; choose from {', '.join(GROUPS)}")
+        day = cube.ledger['day']
+        first = np.datetime64(params['from'], 'D').astype(np.int64) if 'from' in params else int(day[0])
+        last = np.datetime64(params['to'], 'D').astype(np.int64) if 'to' in params else int(day[-1])
+        filters = {FILTERS[name]: self._codes(cube.vocab, name, params[name]) for name in FILTERS if name in params}
+        categories = self._codes(cube.vocab, 'category', params['category']) if 'category' in params else np.arange(len(cube.vocab['category'].labels))
+        category_bits = int(sum(1 << int(c) for c in categories)) if 'category' in params else 0
+
+        keyed = group_by not in (None, 'category')
+        pieces, edges = [], [(first, last)]
+        whole_months = self._whole_months(first, last, int(day[0]), int(day[-1]))
+        if whole_months and 'store_id' not in filters and group_by not in ('day', 'store') and (not category_bits or len(categories) == 1):
+            first_month, last_month = whole_months
+            rows = cube.monthly_rows(first_month, last_month, filters)
+            category_orders = cube.monthly_category_orders[rows][:, categories]
+            orders = category_orders[:, 0] if category_bits else cube.monthly['orders'][rows]
+            values = cube.monthly['month' if group_by == 'month' else FILTERS.get(group_by, group_by)][rows] if keyed else None
+            pieces.append((cube.monthly_revenue[rows][:, categories], orders, category_orders, values))
+            edges = [(first, first_day_of(first_month) - 1), (first_day_of(last_month + 1), last)]
+        for lo, hi in edges:
+            rows = cube.ledger_rows(lo, hi, filters, category_bits)
+            orders = cube.ledger['orders'][rows]
+            category_orders = orders[:, None] * ((cube.ledger['category_mask'][rows][:, None] >> categories) & 1)
+            values = cube.ledger['day' if group_by == 'month' else FILTERS.get(group_by, group_by)][rows] if keyed else None
+            if group_by == 'month':
+                values = values.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+            pieces.append((cube.ledger_revenue[rows][:, categories], orders, category_orders, values))
+
+        revenue, orders, category_orders = (np.concatenate([piece[i] for piece in pieces]) for i in range(3))
+        result = totals(revenue.sum(), orders.sum())
+        if group_by == 'category':
+            result['groups'] = [dict(key=cube.vocab['category'].labels[c], **totals(revenue[:, i].sum(), category_orders[:, i].sum()))
+                                for i, c in enumerate(categories)]
+        elif group_by:
+            keys, inverse = np.unique(np.concatenate([piece[3] for piece in pieces]), return_inverse=True)
+            group_revenue = np.bincount(inverse, weights=revenue.sum(axis=1), minlength=len(keys))
+            group_orders = np.bincount(inverse, weights=orders, minlength=len(keys))
+            result['groups'] = [dict(key=self._label(cube.vocab, group_by, k), **totals(r, o)) for k, r, o in zip(keys, group_revenue, group_orders) if o or r]
+        return result
+
+    def _whole_months(self, first, last, data_first, data_last):
+        """(first, last) month whose days within the data all fall in [first, last], or None if there is none."""
+        first, last = max(first, data_first), min(last, data_last)
+        if first > last:
+            return None
+        first_month, last_month = month_of(first), month_of(last)
+        if first not in (first_day_of(first_month), data_first):
+            first_month += 1
+        if last not in (first_day_of(last_month + 1) - 1, data_last):
+            last_month -= 1
+        return (first_month, last_month) if first_month <= last_month else None
+
+    def _label(self, vocabs, group_by, key):
+        if group_by == 'day':
+            return str(np.datetime64(int(key), 'D'))
+        if group_by == 'month':
+            return str(np.datetime64(int(key), 'M'))
+        if group_by == 'store':
+            return int(key)
+        return vocabs[group_by].labels[key] if key >= 0 else None
+
+    def dimensions(self):
+        cube = self.cube
+        days = cube.ledger['day'] if cube is not None and cube.rows else None
+        return {
+            'from': str(np.datetime64(int(days[0]), 'D')) if days is not None else None,
+            'to': str(np.datetime64(int(days[-1]), 'D')) if days is not None else None,
+            'store': list(cube.stores) if cube is not None else [],
+            **{name: list(vocab.labels) for name, vocab in (cube.vocab if cube is not None else self.vocab).items()},
+            'group_by': GROUPS, 'ledger_rows': cube.rows if cube is not None else 0,
+            'rollup_rows': len(cube.monthly['month']) if cube is not None else 0, 'last_order_id': self.last_order_id,
+        }
+
+def concat_rows(frame, more):
+    """Append `more` to `frame`, either of which may be None."""
+    if frame is None or not len(frame):
+        return more
+    return frame if more is None else pd.concat([frame, more], ignore_index=True)
+
+def totals(revenue, orders):
+    return {'revenue': round(float(revenue), 2), 'orders': int(orders), 'aov': round(float(revenue) / orders, 2) if orders else None}
+
+def make_handler(engine):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            t0 = time.perf_counter()
+            try:
+                if url.path == '/kpi':
+                    payload = engine.kpi(params)
+                elif url.path == '/dimensions':
+                    payload = engine.dimensions()
+                elif url.path == '/refresh':
+                    payload = {'new_orders': engine.refresh()}
+                elif url.path == '/health':
+                    payload = {'status': 'ok'}
+                else:
+                    return self._reply(404, {'error': f"unknown path {url.path}; use /kpi, /dimensions, /refresh or /health"})
+            except ValueError as e:
+                return self._reply(400, {'error': str(e)})
+            except Exception as e:
+                return self._reply(500, {'error': exception_message("Query Service", e)})
+            payload['elapsed_ms'] = round((time.perf_counter() - t0) * 1000, 3)
+            self._reply(200, payload)
+
+        do_POST = do_GET
+
+        def log_message(self, format, *args):
+            verbose_print(f"{self.address_string()} {format % args}", engine.quiet)
+    return Handler
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve filtered revenue / orders / AOV queries over the syndata.py tables")
+    parser.add_argument('--datafolder', type=str, default='.', help='Folder with the tables from syndata.py')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Input format written by syndata.py')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--refresh-seconds', type=float, default=0, help='Check for appended data every N seconds (0: only on /refresh)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Quiet mode')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    engine = QueryEngine(args.datafolder, args.format, args.quiet)
+    engine.refresh()
+    if args.refresh_seconds > 0:
+        def poll():
+            while True:
+                time.sleep(args.refresh_seconds)
+                try:
+                    engine.refresh()
+                except Exception as e:
+                    print(exception_message("Refresh", e))
+        threading.Thread(target=poll, daemon=True).start()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(engine))
+    print(f"[INFO] Serving on http://{args.host}:{args.port} (/kpi, /dimensions, /refresh, /health)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
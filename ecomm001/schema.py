@@ -0,0 +1,67 @@
+"""
+schema.py: Column types and shared vocabularies of the five tables syndata.py writes and ecomm.py reads.
+
+syndata.py draws its categorical values from these lists and ecomm.py loads the tables against them, so
+both sides agree on the categories (and their order) without scanning the data first.
+"""
+
+import numpy as np
+import pandas as pd
+
+GENDERS = ["Female", "Male"]
+METRO_CITIES = ["Mumbai", "Delhi", "Bengaluru", "Hyderabad", "Chennai", "Kolkata"]
+TIER2_CITIES = ["Lucknow", "Jaipur", "Kanpur", "Indore", "Nagpur", "Bhopal"]
+TIER3_CITIES = ["Meerut", "Varanasi", "Jodhpur", "Raipur", "Gorakhpur", "Mysuru"]
+CITIES = METRO_CITIES + TIER2_CITIES + TIER3_CITIES
+PERSONAS = ["Tech Enthusiast", "Fashionista", "Family Shopper"]
+CATEGORIES = ["Electronics", "Fashion", "Groceries", "Personal Care"]
+BRANDS = ["Apple", "Samsung", "Dell", "HP", "Peter England", "Manyavar", "Levi's", "Adidas", "Daawat", "Shan", "Barilla",
+          "Colgate", "Oral-B", "Head & Shoulders", "Pantene", "Pampers", "Himalaya"]
+PAYMENT_METHODS = ["UPI", "Cash on Delivery", "Credit Card", "Debit Card", "E-Wallet", "Net Banking"]
+
+# Column -> dtype per table. A list is a categorical with that vocabulary, 'category' one whose categories
+# come from the data (sorted), 'date' a column parsed to datetime64 and 'time' an HH:MM:SS column parsed to
+# timedelta64, both at load. Amounts and prices are float32: summed amounts are widened to float64 where
+# they are aggregated (see ecomm.build_sales_fact).
+TABLE_SCHEMA = {
+    'customers': {'customer_id': 'int32', 'name': 'object', 'email': 'object', 'gender': GENDERS, 'age': 'int8',
+                  'location': CITIES, 'join_date': 'date', 'persona': PERSONAS},
+    'products': {'sku_id': 'int32', 'product_id': 'object', 'product_code': 'object', 'price': 'float32', 'product_name': 'category',
+                 'description': 'category', 'category': CATEGORIES, 'brand': BRANDS, 'rating': 'float32'},
+    'stores': {'store_id': 'int32', 'location': CITIES},
+    'orders': {'order_id': 'int32', 'customer_id': 'int32', 'store_id': 'int32', 'order_date': 'date', 'order_time': 'time',
+               'payment_method': PAYMENT_METHODS},
+    'lineitems': {'lineitem_id': 'int32', 'order_id': 'int32', 'product_id': 'category', 'sku_id': 'int32', 'quantity': 'int16',
+                  'unit_price': 'float32', 'total_amount': 'float32'},
+}
+
+def read_csv_args(table, columns):
+    """dtype and parse_dates arguments for pd.read_csv of `columns` of `table`."""
+    schema = TABLE_SCHEMA[table]
+    dtype = {c: 'category' if isinstance(schema[c], list) else schema[c] for c in columns if schema[c] not in ('date', 'time')}
+    return {'dtype': dtype, 'parse_dates': [c for c in columns if schema[c] == 'date']}
+
+def conform(df, table):
+    """Cast the columns of a loaded `table` to TABLE_SCHEMA in place and return df.
+
+    Categorical columns get the shared vocabulary followed by any values it lacks (sorted), so unexpected
+    values are kept rather than turned into NaN and CSV and Parquet inputs end up with identical dtypes.
+    """
+    for column, kind in TABLE_SCHEMA[table].items():
+        if column not in df:
+            continue
+        values = df[column]
+        if kind == 'date':
+            df[column] = pd.to_datetime(values)
+        elif kind == 'time':
+            df[column] = pd.to_timedelta(values)
+        elif isinstance(kind, list) or kind == 'category':
+            vocabulary = kind if isinstance(kind, list) else []
+            present = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else values.dropna().unique()
+            extra = sorted(set(present) - set(vocabulary))
+            df[column] = pd.Categorical(values, categories=vocabulary + extra)
+        elif kind != 'object' and values.dtype != kind:
+            if np.issubdtype(np.dtype(kind), np.integer) and len(values) and (values.max() > np.iinfo(kind).max or values.min() < np.iinfo(kind).min):
+                raise ValueError(f"{table}.{column} does not fit in {kind}")
+            df[column] = values.astype(kind)
+    return df
@@ -2,12 +2,22 @@ import argparse
 import random
 import datetime
 from faker import Faker
+import numpy as np
 import pandas as pd
 import os
+import json
+import shutil
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from schema import TABLE_SCHEMA, GENDERS, METRO_CITIES, TIER2_CITIES, TIER3_CITIES, CITIES, PAYMENT_METHODS
 
 fake = Faker()
 
+ORDER_COLUMNS = ["order_id", "customer_id", "store_id", "order_date", "order_time", "payment_method"]
+LINEITEM_COLUMNS = ["lineitem_id", "order_id", "product_id", "sku_id", "quantity", "unit_price", "total_amount"]
+
 def weighted_choice(choices):
     items, weights = zip(*choices)
     return random.choices(items, weights=weights, k=1)[0]
@@ -16,22 +26,36 @@ def main(args):
     os.makedirs(args.output, exist_ok=True)
     csv_encoding = 'utf-8-sig'
 
+    progress = None
+    progress_path = os.path.join(args.output, ShardWriter.PROGRESS_FILE)
+    if args.resume and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            progress = json.load(f)
+        if progress["params"] != progress_params(args):
+            raise SystemExit(f"Cannot resume: {progress_path} was written with different arguments {progress['params']}.")
+        # Customers, products and stores are regenerated from the recorded seed, identical to the interrupted run.
+        args.seed = progress["seed"]
+
+    # One root seed drives every random source; when --seed is omitted a fresh one is drawn and reported.
+    seed_entropy = np.random.SeedSequence(args.seed).entropy
+    print(f"Seed: {seed_entropy}")
+    random.seed(seed_entropy); np.random.seed(seed_entropy % 2**32); Faker.seed(seed_entropy)
+
     personas = { "Tech Enthusiast": {"prevalence": 0.25, "category_prefs": {"Electronics": 0.90, "Fashion": 0.05, "Groceries": 0.05, "Personal Care": 0.0}}, "Fashionista": {"prevalence": 0.30, "category_prefs": {"Electronics": 0.05, "Fashion": 0.90, "Groceries": 0.0, "Personal Care": 0.05}}, "Family Shopper": {"prevalence": 0.45, "category_prefs": {"Electronics": 0.10, "Fashion": 0.10, "Groceries": 0.50, "Personal Care": 0.30}} }
     persona_names, persona_weights = list(personas.keys()), [p['prevalence'] for p in personas.values()]
-    payment_methods = ["UPI", "Cash on Delivery", "Credit Card", "Debit Card", "E-Wallet", "Net Banking"]
+    payment_methods = list(PAYMENT_METHODS)
     payment_weights = [0.40, 0.25, 0.15, 0.10, 0.05, 0.05]
 
     print("Generating customers...")
     customers = []
     for i in range(1, args.customers + 1):
         age = weighted_choice([(random.randint(18, 25), 0.25), (random.randint(26, 40), 0.45), (random.randint(41, 60), 0.25), (random.randint(61, 75), 0.05)])
-        metros = ["Mumbai", "Delhi", "Bengaluru", "Hyderabad", "Chennai", "Kolkata"]; tier2 = ["Lucknow", "Jaipur", "Kanpur", "Indore", "Nagpur", "Bhopal"]; tier3 = ["Meerut", "Varanasi", "Jodhpur", "Raipur", "Gorakhpur", "Mysuru"]
-        city = weighted_choice([(random.choice(metros), 0.5), (random.choice(tier2), 0.3), (random.choice(tier3), 0.2)])
+        city = weighted_choice([(random.choice(METRO_CITIES), 0.5), (random.choice(TIER2_CITIES), 0.3), (random.choice(TIER3_CITIES), 0.2)])
         join_date = fake.date_between(start_date=args.start_date, end_date=args.end_date)
         customer_persona = random.choices(persona_names, weights=persona_weights, k=1)[0]
-        customers.append({"customer_id": i, "name": fake.name(), "email": fake.email(), "gender": random.choices(["Female", "Male"], weights=[0.65, 0.35], k=1)[0], "age": age, "location": city, "join_date": join_date, "persona": customer_persona})
+        customers.append({"customer_id": i, "name": fake.name(), "email": fake.email(), "gender": random.choices(GENDERS, weights=[0.65, 0.35], k=1)[0], "age": age, "location": city, "join_date": join_date, "persona": customer_persona})
     customers_df = pd.DataFrame(customers)
-    customers_df.to_csv(f"{args.output}/customers.csv", index=False, encoding=csv_encoding)
+    write_table(customers_df, args.output, "customers", args.format, csv_encoding, categorical=["gender", "location", "persona"])
 
     print("Generating products...")
     product_catalog = {
@@ -107,19 +131,16 @@ def main(args):
         })
         sku_id += 1
     products_df = pd.DataFrame(products)
-    products_df.to_csv(f"{args.output}/products.csv", index=False, encoding=csv_encoding)
+    write_table(products_df, args.output, "products", args.format, csv_encoding, categorical=["category", "brand"])
 
     # --- THIS IS THE UPDATED STORE GENERATION BLOCK ---
     print("Generating stores...")
-    # Define a list of all real cities from your customer generation logic
-    all_real_cities = ["Mumbai", "Delhi", "Bengaluru", "Hyderabad", "Chennai", "Kolkata", 
-                     "Lucknow", "Jaipur", "Kanpur", "Indore", "Nagpur", "Bhopal", 
-                     "Meerut", "Varanasi", "Jodhpur", "Raipur", "Gorakhpur", "Mysuru"]
+    # Stores are in the same cities as the customers (schema.CITIES)
     stores = []
     for i in range(1, args.stores + 1):
         # Pick a random city from your list of real cities
-        stores.append({"store_id": i, "location": random.choice(all_real_cities)})
-    pd.DataFrame(stores).to_csv(f"{args.output}/stores.csv", index=False, encoding=csv_encoding)
+        stores.append({"store_id": i, "location": random.choice(CITIES)})
+    write_table(pd.DataFrame(stores), args.output, "stores", args.format, csv_encoding, categorical=["location"])
     # --- END OF UPDATED BLOCK ---
 
     print("Generating orders and line items...")
@@ -135,23 +156,186 @@ def main(args):
     except (IndexError, KeyError):
         product_bundles = {}
 
+    n_days = (args.end_date - args.start_date).days + 1
+    shards = [(i, day_start, min(args.batch_days, n_days - day_start), seed_entropy, args.orders_per_day, args.items_per_order) for i, day_start in enumerate(range(0, n_days, args.batch_days))]
+    meta = {"seed": seed_entropy, "params": progress_params(args)}
+    writer = ParquetShardWriter(args.output, payment_methods, meta, progress) if args.format == "parquet" else CsvShardWriter(args.output, csv_encoding, meta, progress)
+    if writer.next_shard:
+        print(f"Resuming at shard {writer.next_shard} of {len(shards)} ({args.start_date + datetime.timedelta(days=shards[writer.next_shard][1]) if writer.next_shard < len(shards) else 'done'}).")
+    pending_shards = shards[writer.next_shard:]
+    if args.engine == "loop":
+        loop_shard = lambda shard: generate_orders_loop(customers_df, products_df, stores, personas, product_bundles, payment_methods, payment_weights, args.start_date + datetime.timedelta(days=shard[1]), shard[2], args.orders_per_day, args.items_per_order)
+        pool, results = None, map(loop_shard, pending_shards)
+    else:
+        ctx = build_order_context(customers_df, products_df, stores, personas, product_bundles, list(product_catalog.keys()), payment_methods, payment_weights, args.start_date)
+        if args.workers > 1:
+            pool = ProcessPoolExecutor(max_workers=args.workers, initializer=init_shard_worker, initargs=(ctx,))
+            results = ordered_results(pool, generate_shard, pending_shards, window=2 * args.workers)
+        else:
+            init_shard_worker(ctx)
+            pool, results = None, map(generate_shard, pending_shards)
+    try:
+        for orders_chunk, lineitems_chunk in tqdm(results, total=len(pending_shards), desc="Generating Order Shards"):
+            writer.write(orders_chunk, lineitems_chunk)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    os.remove(writer.progress_path)
+
+def progress_params(args):
+    """Arguments that must match for a run to resume another run's output."""
+    return {k: str(getattr(args, k)) for k in ("customers", "products", "stores", "orders_per_day", "items_per_order", "start_date", "end_date", "engine", "batch_days", "format")}
+
+def ordered_results(pool, fn, items, window):
+    """Like pool.map, but keeps at most `window` results in flight so finished shards cannot pile up in memory."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def write_table(df, output, name, fmt, encoding, categorical=()):
+    """Write a dimension table as <name>.csv, or as <name>.parquet with dictionary-encoded categorical columns.
+
+    Categories follow the shared vocabulary in schema.TABLE_SCHEMA where it has one, as ecomm.py loads them.
+    """
+    if fmt == "parquet":
+        kinds = TABLE_SCHEMA[name]
+        df.astype({c: pd.CategoricalDtype(kinds[c]) if isinstance(kinds[c], list) else "category" for c in categorical}).to_parquet(os.path.join(output, f"{name}.parquet"), index=False)
+    else:
+        df.to_csv(os.path.join(output, f"{name}.csv"), index=False, encoding=encoding)
+
+class ShardWriter(ABC):
+    """Appends each finished shard to the orders and line-item outputs and checkpoints after it.
+
+    The checkpoint file records the next shard and the next ids, plus whatever the concrete writer needs
+    to roll back a half-written shard. Resuming rolls back and continues from the next shard.
+    """
+
+    PROGRESS_FILE = "_syndata_progress.json"
+
+    def __init__(self, output, meta, progress=None):
+        self.output = output
+        self.progress_path = os.path.join(output, self.PROGRESS_FILE)
+        self.meta = meta
+        self.next_shard = progress["next_shard"] if progress else 0
+        self.order_id = progress["order_id"] if progress else 1
+        self.lineitem_id = progress["lineitem_id"] if progress else 1
+
+    def write(self, orders, lineitems):
+        # Shards number their rows from 1; shift them so ids stay globally unique and contiguous.
+        orders["order_id"] += self.order_id - 1
+        lineitems["order_id"] += self.order_id - 1
+        lineitems["lineitem_id"] += self.lineitem_id - 1
+        self._append(orders, lineitems)
+        self.order_id += len(orders); self.lineitem_id += len(lineitems)
+        self.next_shard += 1
+        state = dict(self.meta, next_shard=self.next_shard, order_id=self.order_id, lineitem_id=self.lineitem_id, **self._checkpoint_state())
+        tmp = self.progress_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.progress_path)
+
+    @abstractmethod
+    def _append(self, orders, lineitems):
+        """Write one shard's rows, ids already shifted."""
+
+    def _checkpoint_state(self):
+        return {}
+
+    def close(self):
+        pass
+
+class CsvShardWriter(ShardWriter):
+    """Appends shards to orders.csv/lineitems.csv; the checkpoint holds both files' byte lengths for truncation."""
+
+    def __init__(self, output, encoding, meta, progress=None):
+        super().__init__(output, meta, progress)
+        self.files = {}
+        for name in ("orders", "lineitems"):
+            path = os.path.join(output, f"{name}.csv")
+            if progress is None:
+                self.files[name] = open(path, "w", encoding=encoding, newline="")
+            else:
+                with open(path, "r+b") as f:
+                    f.truncate(progress["sizes"][name])
+                # The byte-order mark is already at the head of the file, so continue in plain UTF-8.
+                self.files[name] = open(path, "a", encoding="utf-8", newline="")
+
+    def _append(self, orders, lineitems):
+        for name, df in (("orders", orders), ("lineitems", lineitems)):
+            f = self.files[name]
+            df.to_csv(f, index=False, header=f.tell() == 0)
+            f.flush(); os.fsync(f.fileno())
+
+    def _checkpoint_state(self):
+        return {"sizes": {name: f.tell() for name, f in self.files.items()}}
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+class ParquetShardWriter(ShardWriter):
+    """Writes each shard as typed Parquet files under orders/ and lineitems/, hive-partitioned by order_month=YYYY-MM.
+
+    Files are named after their shard, so rolling back a half-written shard just deletes its files.
+    """
+
+    def __init__(self, output, payment_methods, meta, progress=None):
+        super().__init__(output, meta, progress)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pq = pq
+        self.payment_methods = payment_methods
+        self.schemas = {
+            "orders": pa.schema([("order_id", pa.int64()), ("customer_id", pa.int32()), ("store_id", pa.int32()), ("order_date", pa.date32()),
+                                 ("order_time", pa.string()), ("payment_method", pa.dictionary(pa.int8(), pa.string()))]),
+            "lineitems": pa.schema([("lineitem_id", pa.int64()), ("order_id", pa.int64()), ("product_id", pa.dictionary(pa.int32(), pa.string())), ("sku_id", pa.int32()),
+                                    ("quantity", pa.int16()), ("unit_price", pa.float64()), ("total_amount", pa.float64())]),
+        }
+        for name in self.schemas:
+            table_dir = os.path.join(output, name)
+            if progress is None and os.path.isdir(table_dir):
+                shutil.rmtree(table_dir)
+            for root, _, files in os.walk(table_dir):
+                for fname in files:
+                    if int(fname.split("-")[1].split(".")[0]) >= self.next_shard:
+                        os.remove(os.path.join(root, fname))
+
+    def _append(self, orders, lineitems):
+        import pyarrow as pa
+        orders = orders.assign(payment_method=pd.Categorical(orders["payment_method"], categories=self.payment_methods))
+        lineitems = lineitems.assign(product_id=lineitems["product_id"].astype("category"))
+        month = pd.Series(pd.to_datetime(orders["order_date"]).dt.strftime("%Y-%m").to_numpy(), index=orders["order_id"].to_numpy())
+        for name, df, df_month in (("orders", orders, month.to_numpy()), ("lineitems", lineitems, month.reindex(lineitems["order_id"].to_numpy()).to_numpy())):
+            for m in np.unique(df_month):
+                part_dir = os.path.join(self.output, name, f"order_month={m}")
+                os.makedirs(part_dir, exist_ok=True)
+                table = pa.Table.from_pandas(df[df_month == m], preserve_index=False).cast(self.schemas[name])
+                self.pq.write_table(table, os.path.join(part_dir, f"part-{self.next_shard:05d}.parquet"))
+
+def generate_orders_loop(customers_df, products_df, stores, personas, product_bundles, payment_methods, payment_weights, start_date, n_days, orders_per_day, items_per_order):
+    """Reference row-at-a-time generator; slow, kept to validate the batch engine against."""
     orders, lineitems = [], []
     order_id, lineitem_id = 1, 1
-    current_date = args.start_date
-    products_by_category = {cat: products_df[products_df['category'] == cat] for cat in product_catalog.keys()}
+    current_date = start_date
+    products_by_category = {cat: products_df[products_df['category'] == cat] for cat in products_df['category'].unique()}
 
-    for _ in tqdm(range((args.end_date - args.start_date).days + 1), desc="Generating Daily Orders"):
-        for _ in range(args.orders_per_day):
+    for _ in range(n_days):
+        for _ in range(orders_per_day):
             cust = customers_df.sample(1).to_dict('records')[0]
             if current_date < cust["join_date"]: continue
             store = random.choice(stores)
             customer_persona_prefs = personas[cust['persona']]['category_prefs']
             pref_categories, pref_weights = list(customer_persona_prefs.keys()), list(customer_persona_prefs.values())
             current_basket = set()
-            num_items_in_order = random.randint(1, args.items_per_order)
+            num_items_in_order = random.randint(1, items_per_order)
             for _ in range(num_items_in_order):
                 chosen_category = random.choices(pref_categories, weights=pref_weights, k=1)[0]
-                if not products_by_category[chosen_category].empty:
+                if chosen_category in products_by_category and not products_by_category[chosen_category].empty:
                     prod_to_add = products_by_category[chosen_category].sample(1).to_dict('records')[0]
                     current_basket.add(prod_to_add['product_id'])
                     if prod_to_add['product_id'] in product_bundles:
@@ -168,12 +352,120 @@ def main(args):
                     lineitem_id += 1
                 order_id += 1
         current_date += datetime.timedelta(days=1)
+    return pd.DataFrame(orders, columns=ORDER_COLUMNS), pd.DataFrame(lineitems, columns=LINEITEM_COLUMNS)
 
-    print("Saving final CSV files...")
-    pd.DataFrame(orders).to_csv(f"{args.output}/orders.csv", index=False, encoding=csv_encoding)
-    pd.DataFrame(lineitems).to_csv(f"{args.output}/lineitems.csv", index=False, encoding=csv_encoding)
+# Every "HH:MM:SS" string of the day, indexed by second; order times are drawn as integers and looked up here.
+TIME_OF_DAY = np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)], dtype=object)
 
-if __name__ == "__main__":
+def build_order_context(customers_df, products_df, stores, personas, product_bundles, category_names, payment_methods, payment_weights, start_date):
+    """Flatten customers, products, personas and bundles into the NumPy lookup arrays used by generate_orders_batch."""
+    persona_names = list(personas.keys())
+    pref_matrix = np.array([[personas[p]["category_prefs"].get(c, 0.0) for c in category_names] for p in persona_names])
+    pref_cum = np.cumsum(pref_matrix / pref_matrix.sum(axis=1, keepdims=True), axis=1)
+
+    product_ids = products_df["product_id"].to_numpy()
+    product_pos = {pid: i for i, pid in enumerate(product_ids)}
+    product_cat = products_df["category"].map({c: i for i, c in enumerate(category_names)}).to_numpy()
+    by_category = [np.flatnonzero(product_cat == c) for c in range(len(category_names))]
+    cat_size = np.array([len(idx) for idx in by_category])
+
+    bundle_partner = np.full(len(product_ids), -1)
+    bundle_prob = np.zeros(len(product_ids))
+    for prod_id, (paired_product, probability) in product_bundles.items():
+        bundle_partner[product_pos[prod_id]] = product_pos[paired_product]
+        bundle_prob[product_pos[prod_id]] = probability
+
+    return {
+        "start_date": np.datetime64(start_date, "D"),
+        "customer_ids": customers_df["customer_id"].to_numpy(),
+        "join_day": (pd.to_datetime(customers_df["join_date"]).to_numpy().astype("datetime64[D]") - np.datetime64(start_date, "D")).astype(np.int64),
+        "customer_persona": customers_df["persona"].map({p: i for i, p in enumerate(persona_names)}).to_numpy(),
+        "store_ids": np.array([s["store_id"] for s in stores]),
+        "pref_cum": pref_cum,
+        "cat_size": cat_size,
+        "cat_offset": np.concatenate([[0], np.cumsum(cat_size)[:-1]]),
+        "cat_products": np.concatenate(by_category),
+        "bundle_partner": bundle_partner,
+        "bundle_prob": bundle_prob,
+        "product_ids": product_ids,
+        "sku_ids": products_df["sku_id"].to_numpy(),
+        "prices": products_df["price"].to_numpy(),
+        "is_electronics": (products_df["category"] == "Electronics").to_numpy(),
+        "payment_methods": np.asarray(payment_methods, dtype=object),
+        "payment_p": np.asarray(payment_weights) / np.sum(payment_weights),
+    }
+
+_SHARD_CTX = None
+
+def init_shard_worker(ctx):
+    global _SHARD_CTX
+    _SHARD_CTX = ctx
+
+def generate_shard(shard):
+    """Generate one shard of consecutive days, numbering its orders and line items from 1.
+
+    Each shard gets its own generator derived from the root seed and the shard index, so the output
+    depends only on --seed and --batch-days, never on --workers or on scheduling order.
+    """
+    shard_index, day_start, n_days, seed_entropy, orders_per_day, items_per_order = shard
+    rng = np.random.default_rng(np.random.SeedSequence(seed_entropy, spawn_key=(shard_index,)))
+    return generate_orders_batch(_SHARD_CTX, rng, day_start, n_days, orders_per_day, items_per_order, 1, 1)
+
+def generate_orders_batch(ctx, rng, day_start, n_days, orders_per_day, items_per_order, order_id_start, lineitem_id_start):
+    """Generate all orders for days [day_start, day_start + n_days) in one vectorized pass.
+
+    Mirrors generate_orders_loop draw for draw in distribution: uniform customers (skipped before their
+    join date), uniform stores, 1..items_per_order category draws weighted by persona, uniform product
+    within category, bundle partners added with their pairing probability, duplicates collapsed per basket.
+    """
+    n_products = len(ctx["product_ids"])
+    day = np.repeat(np.arange(day_start, day_start + n_days), orders_per_day)
+    cust = rng.integers(0, len(ctx["customer_ids"]), len(day))
+    joined = day >= ctx["join_day"][cust]
+    day, cust = day[joined], cust[joined]
+    n_slots = len(day)
+    store = rng.integers(0, len(ctx["store_ids"]), n_slots)
+
+    item_order = np.repeat(np.arange(n_slots), rng.integers(1, items_per_order + 1, n_slots))
+    pref_cum = ctx["pref_cum"][ctx["customer_persona"][cust[item_order]]]
+    cat = np.minimum((rng.random(len(item_order))[:, None] >= pref_cum).sum(axis=1), pref_cum.shape[1] - 1)
+    stocked = ctx["cat_size"][cat] > 0
+    item_order, cat = item_order[stocked], cat[stocked]
+    size = ctx["cat_size"][cat]
+    prod = ctx["cat_products"][ctx["cat_offset"][cat] + np.minimum((rng.random(len(cat)) * size).astype(np.int64), size - 1)]
+
+    partner = ctx["bundle_partner"][prod]
+    bundled = (partner >= 0) & (rng.random(len(prod)) < ctx["bundle_prob"][prod])
+    basket = np.unique(np.concatenate([item_order, item_order[bundled]]).astype(np.int64) * n_products + np.concatenate([prod, partner[bundled]]))
+    li_slot, li_prod = basket // n_products, basket % n_products
+
+    has_items = np.bincount(li_slot, minlength=n_slots) > 0
+    slot_to_order = np.cumsum(has_items) - 1
+    n_orders, n_lines = int(has_items.sum()), len(li_prod)
+
+    orders = pd.DataFrame({
+        "order_id": order_id_start + np.arange(n_orders),
+        "customer_id": ctx["customer_ids"][cust[has_items]],
+        "store_id": ctx["store_ids"][store[has_items]],
+        "order_date": ctx["start_date"] + day[has_items],
+        "order_time": TIME_OF_DAY[rng.integers(0, 86400, n_orders)],
+        "payment_method": ctx["payment_methods"][rng.choice(len(ctx["payment_p"]), size=n_orders, p=ctx["payment_p"])],
+    })
+    bulk = rng.random(n_lines) < 0.001
+    qty = np.where(bulk, rng.integers(50, 101, n_lines), np.where(ctx["is_electronics"][li_prod], rng.integers(1, 3, n_lines), rng.integers(1, 6, n_lines)))
+    price = ctx["prices"][li_prod]
+    lineitems = pd.DataFrame({
+        "lineitem_id": lineitem_id_start + np.arange(n_lines),
+        "order_id": order_id_start + slot_to_order[li_slot],
+        "product_id": ctx["product_ids"][li_prod],
+        "sku_id": ctx["sku_ids"][li_prod],
+        "quantity": qty,
+        "unit_price": price,
+        "total_amount": np.round(price * qty, 2),
+    })
+    return orders, lineitems
+
+def parse_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("--customers", type=int, default=10000)
     parser.add_argument("--products", type=int, default=1000)
@@ -183,6 +475,18 @@ if __name__ == "__main__":
     parser.add_argument("--from", dest="start_date", type=lambda s: datetime.datetime.strptime(s, "%Y-%m-%d").date(), default=datetime.date(2020, 4, 1))
     parser.add_argument("--to", dest="end_date", type=lambda s: datetime.datetime.strptime(s, "%Y-%m-%d").date(), default=datetime.date(2025, 3, 31))
     parser.add_argument("--output", type=str, default=".")
-    args = parser.parse_args()
+    parser.add_argument("--engine", choices=["batch", "loop"], default="batch", help="batch: vectorized NumPy generation (default); loop: original row-at-a-time generator")
+    parser.add_argument("--batch-days", type=int, default=30, help="Days generated per vectorized batch (one shard)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes generating shards in parallel (batch engine only)")
+    parser.add_argument("--seed", type=int, default=None, help="Root seed; identical seeds and --batch-days give byte-identical output")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="csv: the original CSV files; parquet: typed, dictionary-encoded Parquet with orders/lineitems partitioned by month")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run in --output from its last completed shard")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and args.engine == "loop":
+        parser.error("--workers requires --engine batch")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
     main(args)
     print(f"\n✅ Data generation complete. Files saved in '{args.output}' folder.")
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import syndata  # noqa: E402
+
+SMALL = ["--customers", "300", "--products", "60", "--stores", "10", "--orders-per-day", "40", "--from", "2023-01-01", "--to", "2023-03-31"]
+
+
+def generate(folder, *extra, seed=7):
+    """Run syndata.main for a small three-month dataset in `folder` and return the folder."""
+    syndata.main(syndata.parse_args(SMALL + ["--seed", str(seed), "--output", str(folder), *extra]))
+    return str(folder)
+
+
+@pytest.fixture(scope="session")
+def dataset(tmp_path_factory):
+    """A small CSV dataset shared by the read-only tests."""
+    return generate(tmp_path_factory.mktemp("csv"))
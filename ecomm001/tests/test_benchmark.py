@@ -0,0 +1,25 @@
+import benchmark
+import ecomm
+
+
+# --- benchmark harness (user-012) ------------------------------------------------------------------------------
+
+def failing_analysis():
+    try:
+        raise ValueError("broken")
+    except ValueError as e:
+        return None, ecomm.exception_message("Broken", e)
+
+
+def test_stage_reporting_an_error_is_failed():
+    assert benchmark.measure(lambda: None, 2, False)[2] is False
+    assert benchmark.measure(failing_analysis, 2, False)[2] is True
+    assert benchmark.measure(lambda: 1 / 0, 2, False) == (None, None, True)
+
+
+def test_compare_leaves_out_untimed_and_failed_stages():
+    def row(stage, seconds, failed=False):
+        return {'dataset': '10k', 'stage': stage, 'seconds': seconds, 'peak_mb': None, 'failed': failed}
+    baseline = {'results': [row('syndata.main', 1.0), row('fraud_detection', 1.0, failed=True), row('geo', 1.0)]}
+    results = [row('syndata.main', None), row('fraud_detection', 5.0), row('geo', 5.0)]
+    assert benchmark.compare(results, baseline, 0.2, 0.05) == ["10k/geo: 1.000s -> 5.000s"]
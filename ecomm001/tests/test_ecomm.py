@@ -0,0 +1,410 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ecomm
+from conftest import generate
+from schema import TABLE_SCHEMA
+
+
+def full_tables(folder, fmt="csv"):
+    dfs = ecomm.load_data(folder, True, fmt)
+    return dfs, ecomm.build_sales_fact(dfs["customers"], dfs["products"], dfs["orders"], dfs["lineitems"], True)
+
+
+def assert_same_state(state, expected):
+    state, expected = (s.sort_values("customer_id").reset_index(drop=True) for s in (state, expected))
+    pd.testing.assert_frame_equal(state, expected, check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+# --- incremental RFM state (user-008) --------------------------------------------------------------------------
+
+def truncate_csv(folder, table, last_order_id):
+    """Cut <table>.csv after the last row of `last_order_id`, returning the bytes removed."""
+    path = os.path.join(folder, f"{table}.csv")
+    data = open(path, "rb").read()
+    frame = pd.read_csv(path)
+    keep = int((frame["order_id"] <= last_order_id).sum())
+    end = sum(len(line) for line in data.splitlines(keepends=True)[:keep + 1])
+    open(path, "wb").write(data[:end])
+    return data[end:]
+
+
+def test_rfm_state_plus_appended_csv_rows_equals_full_recompute(dataset, tmp_path):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    state_path = str(tmp_path / "rfm.pkl")
+    rest = {table: truncate_csv(folder, table, 1000) for table in ("orders", "lineitems")}
+    first = ecomm.refresh_rfm_state(state_path, folder, "csv", quiet=True)
+    assert first["frequency"].sum() == 1000
+
+    for table, data in rest.items():
+        with open(os.path.join(folder, f"{table}.csv"), "ab") as f:
+            f.write(data)
+    state = ecomm.refresh_rfm_state(state_path, folder, "csv", quiet=True)
+    dfs, fact = full_tables(folder)
+    assert_same_state(state, ecomm.rfm_aggregates(dfs["orders"], fact))
+    assert ecomm.load_rfm_state(state_path)["last_order_id"] == dfs["orders"]["order_id"].max()
+
+
+def test_rfm_state_with_line_items_lagging_orders_equals_full_recompute(dataset, tmp_path):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    state_path = str(tmp_path / "rfm.pkl")
+    path = os.path.join(folder, "lineitems.csv")
+    data = open(path, "rb").read()
+    # Orders run ahead of their line items, and each cut leaves a partial last line (the second inside order 990's items).
+    rest = {"orders": truncate_csv(folder, "orders", 1000), "lineitems": truncate_csv(folder, "lineitems", 989)}
+    lines_990 = rest["lineitems"].split(b"\n")[0] + b"\n"
+    cut = len(data) - len(rest["lineitems"]) + len(lines_990) + 7
+    open(path, "wb").write(data[:cut])
+    first = ecomm.refresh_rfm_state(state_path, folder, "csv", quiet=True)
+    assert first["frequency"].sum() == 990
+
+    with open(os.path.join(folder, "orders.csv"), "ab") as f:
+        f.write(rest["orders"])
+    open(path, "wb").write(data)
+    state = ecomm.refresh_rfm_state(state_path, folder, "csv", quiet=True)
+    dfs, fact = full_tables(folder)
+    assert_same_state(state, ecomm.rfm_aggregates(dfs["orders"], fact))
+
+
+def test_rfm_state_rebuilds_when_csv_was_rewritten(dataset, tmp_path):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    state_path = str(tmp_path / "rfm.pkl")
+    ecomm.refresh_rfm_state(state_path, folder, "csv", quiet=True)
+    generate(folder, seed=8)
+    state = ecomm.refresh_rfm_state(state_path, folder, "csv", quiet=True)
+    dfs, fact = full_tables(folder)
+    assert_same_state(state, ecomm.rfm_aggregates(dfs["orders"], fact))
+
+
+def test_rfm_state_plus_new_parquet_parts_equals_full_recompute(tmp_path):
+    source = generate(tmp_path / "source", "--format", "parquet")
+    folder = str(tmp_path / "data")
+    shutil.copytree(source, folder, ignore=shutil.ignore_patterns("order_month=2023-03"))
+    state_path = str(tmp_path / "rfm.pkl")
+    first = ecomm.refresh_rfm_state(state_path, folder, "parquet", quiet=True)
+
+    for part in glob.glob(os.path.join(source, "*", "order_month=2023-03")):
+        shutil.copytree(part, os.path.join(folder, os.path.relpath(part, source)))
+    state = ecomm.refresh_rfm_state(state_path, folder, "parquet", quiet=True)
+    dfs, fact = full_tables(folder, "parquet")
+    assert first["frequency"].sum() < len(dfs["orders"])
+    assert_same_state(state, ecomm.rfm_aggregates(dfs["orders"], fact))
+
+
+def test_rfm_refresh_reads_only_new_csv_rows(dataset, tmp_path, monkeypatch):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    state_path = str(tmp_path / "rfm.pkl")
+    ecomm.refresh_rfm_state(state_path, folder, "csv", quiet=True)
+    read, real = [], ecomm.read_new_rows
+
+    def spy(*args, **kwargs):
+        rows, mark = real(*args, **kwargs)
+        read.append(len(rows))
+        return rows, mark
+    monkeypatch.setattr(ecomm, "read_new_rows", spy)
+    state = ecomm.refresh_rfm_state(state_path, folder, "csv", quiet=True)
+    assert read == [0, 0]
+    assert state["frequency"].sum() == len(ecomm.load_data(folder, True, "csv", {"orders": ["order_id"]})["orders"])
+
+
+# --- market basket analysis (user-007) -------------------------------------------------------------------------
+
+@pytest.mark.parametrize("chunk_orders", [2, 250_000])
+def test_basket_rules_match_hand_computed_pairs(chunk_orders):
+    products = pd.DataFrame({"product_name": ["A", "B", "C", "D"]})
+    baskets = {1: "AB", 2: "ABC", 3: "AC", 4: "B", 5: "ABA", 6: "D"}
+    fact = pd.DataFrame([(order, "ABCD".index(item)) for order, items in baskets.items() for item in items], columns=["order_id", "product_idx"])
+    rules, _, summary = ecomm.market_basket_analysis(fact, products, True, min_support=0.3, chunk_orders=chunk_orders)
+    # A in 4 of 6 orders, B in 4, C in 2, D in 1 (below support); A+B in 3, A+C in 2, B+C in 1 (below support).
+    expected = pd.DataFrame({
+        "antecedents": ["C", "A", "B", "A"], "consequents": ["A", "B", "A", "C"],
+        "antecedent support": [2 / 6, 4 / 6, 4 / 6, 4 / 6], "consequent support": [4 / 6, 4 / 6, 4 / 6, 2 / 6],
+        "support": [2 / 6, 3 / 6, 3 / 6, 2 / 6], "confidence": [1.0, 0.75, 0.75, 0.5], "lift": [1.5, 1.125, 1.125, 1.5],
+    })
+    pd.testing.assert_frame_equal(rules, expected, check_dtype=False)
+    assert summary.startswith("4 association rules")
+
+
+# --- out-of-core aggregates (user-010) -------------------------------------------------------------------------
+
+def test_streaming_aggregates_match_in_memory_with_missing_labels(dataset, tmp_path):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    for table, column in (("customers", "persona"), ("products", "category")):
+        frame = pd.read_csv(os.path.join(folder, f"{table}.csv"))
+        frame.loc[::7, column] = None
+        frame.to_csv(os.path.join(folder, f"{table}.csv"), index=False)
+    dfs, fact = full_tables(folder)
+    aggregates = ecomm.streaming_aggregates(folder, "csv", dfs["customers"], dfs["products"], 500, True)
+
+    streamed, in_memory = (ecomm.sales_conversion_analysis(fact, True, a)[0] for a in (aggregates, None))
+    pd.testing.assert_series_equal(streamed, in_memory, check_names=False, check_index_type=False, check_categorical=False)
+    streamed, in_memory = (ecomm.customer_personalization(fact, True, a)[0] for a in (aggregates, None))
+    assert streamed == in_memory
+    for streamed, in_memory in zip(*(ecomm.product_performance(fact, True, a)[:2] for a in (aggregates, None))):
+        pd.testing.assert_frame_equal(streamed, in_memory, check_dtype=False, check_categorical=False)
+    assert_same_state(aggregates["rfm_state"], ecomm.rfm_aggregates(dfs["orders"], fact))
+
+
+def test_rfm_state_is_rejected_in_out_of_core_mode(monkeypatch):
+    monkeypatch.setattr("sys.argv", ["ecomm.py", "--chunk-size", "1000", "--rfm-state", "rfm.pkl"])
+    with pytest.raises(SystemExit):
+        ecomm.parse_args()
+
+
+# --- parallel sections (user-006) -------------------------------------------------------------------------------
+
+def read_report(folder):
+    with open(os.path.join(folder, "report.json")) as f:
+        return {section["section"]: section for section in json.load(f)}
+
+
+def test_parallel_sections_match_a_serial_run(dataset, tmp_path, monkeypatch):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    run_report(monkeypatch, folder, "--no-cache")
+    serial = read_report(folder)
+    timings = run_report(monkeypatch, folder, "--no-cache", "--jobs", "2")
+    assert read_report(folder) == serial
+    assert len({timings[f"section:{key}"]["pid"] for key in serial}) > 1
+
+
+def test_failing_and_dying_section_workers_are_reported(dataset, tmp_path, monkeypatch):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+
+    def broken(data, args):
+        raise RuntimeError("broken section")
+
+    def dying(data, args):
+        os._exit(1)
+    sections = list(ecomm.REPORT_SECTIONS)
+    for index, runner in ((2, broken), (7, dying)):
+        key, title, _ = sections[index]
+        sections[index] = (key, title, runner)
+    monkeypatch.setattr(ecomm, "REPORT_SECTIONS", sections)
+    run_report(monkeypatch, folder, "--no-cache", "--jobs", "2", "--sections", "sales,geo")
+    report = read_report(folder)
+    assert "RuntimeError: broken section" in report["sales"]["summary"]
+    assert "ERROR" in report["geo"]["summary"]
+
+
+# --- persisted fraud model (user-009) --------------------------------------------------------------------------
+
+def test_fraud_model_is_trained_once_then_reused_until_retrained(dataset, tmp_path):
+    dfs, fact = full_tables(dataset)
+    features = ecomm.build_fraud_features(fact, dfs["orders"])
+    path = str(tmp_path / "fraud.joblib")
+    first, trained = ecomm.load_or_train_fraud_model(features, path, quiet=True)
+    assert trained and os.path.exists(path)
+    stamp = os.stat(path).st_mtime_ns
+    reused, trained = ecomm.load_or_train_fraud_model(features.head(100), path, quiet=True)
+    assert not trained and os.stat(path).st_mtime_ns == stamp
+    X = features[ecomm.FRAUD_FEATURES].to_numpy()
+    np.testing.assert_array_equal(reused.score_samples(X), first.score_samples(X))
+    retrained, trained = ecomm.load_or_train_fraud_model(features.head(100), path, retrain=True, quiet=True)
+    assert trained and os.stat(path).st_mtime_ns != stamp
+    assert not np.array_equal(retrained.score_samples(X), first.score_samples(X))
+
+
+def test_fraud_since_scores_only_recent_orders(dataset, tmp_path):
+    dfs, fact = full_tables(dataset)
+    path = str(tmp_path / "fraud.joblib")
+    everything, summary = ecomm.fraud_detection(fact, dfs["orders"], True, path)
+    recent, recent_summary = ecomm.fraud_detection(fact, dfs["orders"], True, path, since="2023-03-01")
+    assert f"among {len(dfs['orders'])} scored orders" in summary
+    assert f"among {int((dfs['orders']['order_date'] >= '2023-03-01').sum())} scored orders" in recent_summary
+    assert set(recent["order_id"]) <= set(everything["order_id"])
+
+
+def test_cached_fraud_summary_does_not_claim_a_new_model(dataset, tmp_path, monkeypatch):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    model = str(tmp_path / "fraud.joblib")
+    run_report(monkeypatch, folder, "--sections", "fraud", "--fraud-model", model)
+    timings = run_report(monkeypatch, folder, "--sections", "fraud", "--fraud-model", model)
+    assert timings["section:fraud"]["cache"] == "hit"
+    assert "trained" not in read_report(folder)["fraud"]["summary"]
+
+
+# --- report cache (user-011) -----------------------------------------------------------------------------------
+
+def run_report(monkeypatch, folder, *extra):
+    """Run ecomm.main on `folder` with JSON output and return its stage timings."""
+    monkeypatch.setattr("sys.argv", ["ecomm.py", "--datafolder", str(folder), "-q", "--output-format", "json", *extra])
+    ecomm.main()
+    with open(os.path.join(folder, "report_timings.json")) as f:
+        return {record["stage"]: record for record in json.load(f)}
+
+
+def test_fraud_key_follows_model_file_content(dataset, tmp_path):
+    cache = ecomm.ReportCache(str(tmp_path / "cache"), 1 << 20)
+    model = tmp_path / "model.pkl"
+    args = argparse.Namespace(datafolder=dataset, format="csv", sections=["fraud"], fraud_model=str(model), fraud_since=None, chunk_size=None)
+    keys = [ecomm.section_cache_keys(cache, args)["fraud"]]
+    for content in (b"first model", b"second model"):
+        model.write_bytes(content)
+        keys.append(ecomm.section_cache_keys(cache, args)["fraud"])
+    assert len(set(keys)) == 3
+
+
+def test_code_version_covers_every_local_module(tmp_path):
+    here = os.path.dirname(os.path.abspath(ecomm.__file__))
+    for name in ("ecomm.py", "schema.py"):
+        shutil.copy(os.path.join(here, name), tmp_path)
+    before = ecomm.source_hash(str(tmp_path))
+    with open(tmp_path / "schema.py", "a") as f:
+        f.write("\n# changed\n")
+    assert ecomm.source_hash(str(tmp_path)) != before
+
+
+def test_cache_hit_still_refreshes_rfm_state(dataset, tmp_path, monkeypatch):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    run_report(monkeypatch, folder, "--sections", "customers")
+    state_path = str(tmp_path / "rfm.pkl")
+    timings = run_report(monkeypatch, folder, "--sections", "customers", "--rfm-state", state_path)
+    assert timings["section:customers"]["cache"] == "hit"
+    assert ecomm.load_rfm_state(state_path)["last_order_id"] == len(pd.read_csv(os.path.join(folder, "orders.csv")))
+
+
+def test_failed_section_is_not_cached(dataset, tmp_path, monkeypatch):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+
+    def broken(state):
+        raise ValueError("broken")
+    with monkeypatch.context() as patch:
+        patch.setattr(ecomm, "score_rfm", broken)
+        run_report(patch, folder, "--sections", "customers,geo")
+    timings = run_report(monkeypatch, folder, "--sections", "customers,geo")
+    assert timings["section:customers"]["cache"] == "miss"
+    assert timings["section:geo"]["cache"] == "hit"
+
+
+# --- section selection (user-015) ------------------------------------------------------------------------------
+
+def test_cached_sections_load_nothing(dataset, tmp_path, monkeypatch):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    run_report(monkeypatch, folder, "--sections", "customers,cohort")
+    timings = run_report(monkeypatch, folder, "--sections", "customers,cohort,geo")
+    assert timings["section:cohort"]["cache"] == "hit" and timings["section:geo"]["cache"] == "miss"
+    assert "build_sales_fact" not in timings and "rfm_state" not in timings
+
+
+def test_empty_section_list_is_rejected(monkeypatch, capsys):
+    monkeypatch.setattr("sys.argv", ["ecomm.py", "--sections", ","])
+    with pytest.raises(SystemExit):
+        ecomm.parse_args()
+    assert "no section given" in capsys.readouterr().err
+
+
+# --- typed loading (user-016) ---------------------------------------------------------------------------------
+
+def test_csv_and_parquet_load_to_the_same_dtypes(dataset, tmp_path):
+    csv = ecomm.load_data(dataset, True, "csv")
+    parquet = ecomm.load_data(generate(tmp_path, "--format", "parquet"), True, "parquet")
+    for table, schema in TABLE_SCHEMA.items():
+        assert list(csv[table].columns) == list(schema), table
+        pd.testing.assert_series_equal(csv[table].dtypes, parquet[table][list(schema)].dtypes, obj=table)
+        for column, kind in schema.items():
+            if isinstance(kind, list) or kind == "category":
+                assert list(csv[table][column].cat.categories) == list(parquet[table][column].cat.categories), (table, column)
+            if isinstance(kind, list):
+                assert list(csv[table][column].cat.categories[:len(kind)]) == kind, (table, column)
+            elif kind in ("int32", "float32"):
+                assert csv[table][column].dtype == kind, (table, column)
+
+
+# --- cohort matrices (user-017) --------------------------------------------------------------------------------
+
+def month_number(dates):
+    return dates.dt.year * 12 + dates.dt.month - 1
+
+
+def pandas_cohorts(customers, fact, by):
+    """Cohort sizes, active customers and revenue per (cohort, months since) cell, by plain groupbys."""
+    activity = fact.assign(month=month_number(fact["order_date"])).groupby(["customer_id", "month"])["total_amount"].sum().reset_index()
+    if by == "join":
+        cohort = pd.Series(month_number(customers["join_date"]).to_numpy(), index=customers["customer_id"])
+    else:
+        cohort = activity.groupby("customer_id")["month"].min()
+    last = activity["month"].max()
+    cohort = cohort[cohort <= last]
+    activity["cohort"] = activity["customer_id"].map(cohort)
+    activity["offset"] = activity["month"] - activity["cohort"]
+    activity = activity[activity["offset"] >= 0]
+    cells = activity.groupby(["cohort", "offset"])
+    return cohort.value_counts(), cells["customer_id"].nunique(), cells["total_amount"].sum(), last
+
+
+@pytest.mark.parametrize("by", ["first-order", "join"])
+def test_cohort_matrices_match_pandas_reference(dataset, by):
+    dfs, fact = full_tables(dataset)
+    state = ecomm.rfm_aggregates(dfs["orders"], fact)
+    retention, revenue, _, summary = ecomm.cohort_analysis(dfs["customers"], fact, True, state, by=by)
+    assert "ERROR" not in summary
+    sizes, active, spend, last = pandas_cohorts(dfs["customers"], fact, by)
+
+    label = {m: f"{m // 12}-{m % 12 + 1:02d}" for m in sizes.index}
+    assert retention["customers"].to_dict() == {label[m]: n for m, n in sizes.items()}
+    for cohort in sizes.index:
+        observed = range(last - cohort + 1)
+        row = retention.loc[label[cohort]]
+        expected = [round(100 * active.get((cohort, k), 0) / sizes[cohort], 1) for k in observed]
+        assert row[list(observed)].tolist() == pytest.approx(expected)
+        assert revenue.loc[label[cohort], list(observed)].tolist() == pytest.approx([round(spend.get((cohort, k), 0.0), 2) for k in observed])
+        assert row.drop("customers").iloc[len(observed):].isna().all()
+
+
+# --- per-customer recommendations (user-019) -------------------------------------------------------------------
+
+def naive_scores(fact, customers, products):
+    """Dense item-item cosine scores with bought products masked out, as recommend_products defines them."""
+    rows = pd.Index(customers["customer_id"]).get_indexer(fact["customer_id"])
+    bought = np.zeros((len(customers), len(products)))
+    bought[rows, fact["product_idx"].to_numpy()] = 1
+    buyers = bought.sum(axis=0)
+    scale = 1 / np.sqrt(np.maximum(buyers, 1))
+    similarity = scale[:, None] * (bought.T @ bought) * scale[None, :]
+    np.fill_diagonal(similarity, 0)
+    scores = bought @ similarity + buyers / buyers.max() * 1e-6
+    scores[bought > 0] = -np.inf
+    return scores
+
+
+def test_recommendations_match_naive_scoring(dataset):
+    dfs, fact = full_tables(dataset)
+    recommendations, summary = ecomm.recommend_products(fact, dfs["customers"], dfs["products"], True, top_n=5)
+    assert "ERROR" not in summary
+    scores = naive_scores(fact, dfs["customers"], dfs["products"])
+    rows = pd.Index(dfs["customers"]["customer_id"]).get_indexer(recommendations["customer_id"])
+    cols = pd.Index(dfs["products"]["product_id"]).get_indexer(recommendations["product_id"])
+    assert np.isfinite(scores[rows, cols]).all(), "a bought product was recommended"
+    assert recommendations["score"].to_numpy() == pytest.approx(scores[rows, cols], rel=1e-4, abs=1e-6)
+    best = -np.sort(-scores, axis=1)[:, :5]
+    per_customer = recommendations.pivot(index="customer_id", columns="rank", values="score").reindex(dfs["customers"]["customer_id"])
+    assert per_customer.to_numpy() == pytest.approx(np.where(np.isfinite(best), best, np.nan), rel=1e-4, abs=1e-6, nan_ok=True)
+
+
+def test_recommendations_do_not_depend_on_block_size_or_sparse_similarity(dataset, monkeypatch):
+    dfs, fact = full_tables(dataset)
+    expected, _ = ecomm.recommend_products(fact, dfs["customers"], dfs["products"], True, top_n=5)
+    monkeypatch.setattr(ecomm, "RECOMMENDATION_BLOCK_CELLS", 7 * len(dfs["products"]))
+    monkeypatch.setattr(ecomm, "DENSE_SIMILARITY_CELLS", 0)
+    blocked, _ = ecomm.recommend_products(fact, dfs["customers"], dfs["products"], True, top_n=5)
+    pd.testing.assert_frame_equal(blocked[["customer_id", "rank"]], expected[["customer_id", "rank"]])
+    assert blocked["score"].to_numpy() == pytest.approx(expected["score"].to_numpy(), abs=1e-6)
+
+
+def test_recommendations_file_is_written_on_cache_hits(dataset, tmp_path, monkeypatch):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    path = os.path.join(folder, "recommendations.csv")
+    run_report(monkeypatch, folder, "--sections", "personalization", "--top-n", "3")
+    first = pd.read_csv(path)
+    os.remove(path)
+    timings = run_report(monkeypatch, folder, "--sections", "personalization", "--top-n", "3")
+    assert timings["section:personalization"]["cache"] == "hit"
+    pd.testing.assert_frame_equal(pd.read_csv(path), first)
+    assert first["rank"].max() == 3
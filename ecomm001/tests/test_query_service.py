@@ -0,0 +1,124 @@
+import glob
+import itertools
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from conftest import generate
+from query_service import Postings, QueryEngine, select_rows
+
+RANGES = [{}, {"from": "2023-02-01", "to": "2023-02-28"}, {"from": "2023-01-10", "to": "2023-03-05"}, {"from": "2023-02-03", "to": "2023-02-20"}]
+FILTERS = [{}, {"city": "Delhi,Mumbai"}, {"store": "1,2,7"}, {"category": "Electronics"}, {"category": "Electronics,Groceries", "payment_method": "UPI"}]
+GROUPS = [None, "day", "month", "store", "city", "persona", "category"]
+
+
+def answers(engine):
+    return {str(params): engine.kpi(params) for params in
+            ({**r, **f, **({"group_by": g} if g else {})} for r, f, g in itertools.product(RANGES, FILTERS, GROUPS))}
+
+
+def assert_same_answers(engine, folder, fmt):
+    full = QueryEngine(folder, fmt, quiet=True)
+    full.refresh()
+    assert engine.dimensions()["last_order_id"] == full.dimensions()["last_order_id"]
+    assert_close(answers(engine), answers(full))
+
+
+def assert_close(a, b):
+    """Recursive equality with a cent of slack on rounded revenue figures."""
+    if isinstance(a, dict):
+        assert a.keys() == b.keys()
+        for key in a:
+            assert_close(a[key], b[key])
+    elif isinstance(a, list):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            assert_close(x, y)
+    elif isinstance(a, float) and isinstance(b, float):
+        assert a == pytest.approx(b, abs=0.011)
+    else:
+        assert a == b
+
+
+# --- incremental refresh (user-018) ----------------------------------------------------------------------------
+
+def test_csv_appends_refresh_to_the_same_answers_as_a_full_load(dataset, tmp_path):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    tables = {table: open(os.path.join(dataset, f"{table}.csv"), "rb").read() for table in ("orders", "lineitems")}
+    engine = QueryEngine(str(folder), "csv", quiet=True)
+    # Cut both files mid-line and at different points, so orders wait for their line items and late line items reopen an order.
+    for orders_share, lines_share in ((0.3, 0.25), (0.5, 0.52), (0.51, 0.51), (0.9, 0.8), (1.0, 1.0)):
+        for table, share in (("orders", orders_share), ("lineitems", lines_share)):
+            with open(os.path.join(folder, f"{table}.csv"), "wb") as f:
+                f.write(tables[table][:int(len(tables[table]) * share)])
+        engine.refresh()
+    assert_same_answers(engine, str(folder), "csv")
+
+
+def test_new_parquet_parts_refresh_to_the_same_answers_as_a_full_load(tmp_path):
+    source = generate(tmp_path / "source", "--format", "parquet")
+    folder = str(tmp_path / "data")
+    shutil.copytree(source, folder, ignore=shutil.ignore_patterns("order_month=2023-03"))
+    engine = QueryEngine(folder, "parquet", quiet=True)
+    engine.refresh()
+    for part in glob.glob(os.path.join(source, "*", "order_month=2023-03")):
+        shutil.copytree(part, os.path.join(folder, os.path.relpath(part, source)))
+    engine.refresh()
+    assert_same_answers(engine, folder, "parquet")
+
+
+def test_rewritten_csv_triggers_a_rebuild(dataset, tmp_path):
+    folder = shutil.copytree(dataset, tmp_path / "data")
+    engine = QueryEngine(str(folder), "csv", quiet=True)
+    engine.refresh()
+    generate(folder, "--to", "2023-02-15")
+    engine.refresh()
+    assert_same_answers(engine, str(folder), "csv")
+
+
+def test_rollup_is_coarser_than_the_ledger(dataset):
+    engine = QueryEngine(dataset, "csv", quiet=True)
+    engine.refresh()
+    dimensions = engine.dimensions()
+    assert dimensions["rollup_rows"] < dimensions["ledger_rows"] / 2
+
+
+def test_unknown_labels_are_rejected(dataset):
+    engine = QueryEngine(dataset, "csv", quiet=True)
+    engine.refresh()
+    with pytest.raises(ValueError, match="unknown city"):
+        engine.kpi({"city": "Atlantis"})
+    with pytest.raises(ValueError, match="unknown group_by"):
+        engine.kpi({"group_by": "weekday"})
+
+
+def test_indexed_selection_matches_a_full_scan():
+    rng = np.random.default_rng(0)
+    columns = {"city": rng.integers(0, 18, 5000), "store_id": rng.integers(1, 250, 5000), "category_mask": rng.integers(0, 16, 5000)}
+    index = {}
+    for name, values in (("city", columns["city"]), ("store_id", columns["store_id"])):
+        index[name] = Postings()
+        for start in range(0, 5000, 700):
+            index[name].append(values[start:start + 700], start)
+    index["category"] = Postings()
+    for c in range(4):
+        index["category"].add(c, np.flatnonzero(columns["category_mask"] >> c & 1))
+    index = {name: postings.snapshot() for name, postings in index.items()}
+    filters = {"city": np.array([2, 5, 17]), "store_id": np.array([7, 8, 400])}
+    scan = np.isin(columns["city"], filters["city"]) & np.isin(columns["store_id"], filters["store_id"]) & ((columns["category_mask"] & 0b0100) != 0)
+    scan[:1200] = scan[4100:] = False
+    np.testing.assert_array_equal(select_rows(1200, 4100, filters, index, columns, 0b0100), np.flatnonzero(scan))
+    assert select_rows(10, 20, {}, index, columns) == slice(10, 20)
+
+
+def test_queries_decode_with_the_vocabulary_of_their_snapshot(dataset):
+    engine = QueryEngine(dataset, "csv", quiet=True)
+    engine.refresh()
+    before = engine.kpi({"group_by": "city"})
+    cube = engine.cube
+    engine.vocab["city"].labels.reverse()
+    engine.reset()
+    engine.cube = cube
+    assert engine.kpi({"group_by": "city"}) == before
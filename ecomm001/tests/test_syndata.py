@@ -0,0 +1,136 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import syndata
+from conftest import generate
+
+
+def read(folder, table):
+    return pd.read_csv(os.path.join(folder, f"{table}.csv"))
+
+
+# --- batch engine (user-001) -----------------------------------------------------------------------------------
+
+def test_batch_output_is_consistent(dataset):
+    customers, products, orders, lines = (read(dataset, t) for t in ("customers", "products", "orders", "lineitems"))
+    assert (orders["order_id"] == np.arange(1, len(orders) + 1)).all()
+    assert (lines["lineitem_id"] == np.arange(1, len(lines) + 1)).all()
+    assert set(lines["order_id"]) == set(orders["order_id"])
+    assert not lines.duplicated(["order_id", "product_id"]).any()
+
+    joined = orders.merge(customers[["customer_id", "join_date"]], on="customer_id")
+    assert (joined["order_date"] >= joined["join_date"]).all()
+
+    priced = lines.merge(products[["product_id", "price", "category"]], on="product_id")
+    assert np.allclose(priced["unit_price"], priced["price"])
+    assert np.allclose(priced["total_amount"], (priced["unit_price"] * priced["quantity"]).round(2))
+    bulk = priced["quantity"] >= 50
+    assert priced.loc[bulk, "quantity"].le(100).all()
+    regular = priced[~bulk]
+    assert regular.loc[regular["category"] == "Electronics", "quantity"].between(1, 2).all()
+    assert regular["quantity"].between(1, 5).all()
+
+
+def test_batch_matches_loop_engine_in_distribution(dataset, tmp_path):
+    loop = generate(tmp_path, "--engine", "loop")
+    stats = {}
+    for name, folder in (("batch", dataset), ("loop", loop)):
+        orders, lines, products = read(folder, "orders"), read(folder, "lineitems"), read(folder, "products")
+        lines = lines.merge(products[["product_id", "category"]], on="product_id")
+        stats[name] = {
+            "orders": len(orders),
+            "items_per_order": len(lines) / len(orders),
+            "category": lines["category"].value_counts(normalize=True),
+            "payment": orders["payment_method"].value_counts(normalize=True),
+        }
+    batch, loop = stats["batch"], stats["loop"]
+    assert batch["orders"] == pytest.approx(loop["orders"], rel=0.1)
+    assert batch["items_per_order"] == pytest.approx(loop["items_per_order"], rel=0.1)
+    for key in ("category", "payment"):
+        diff = batch[key].sub(loop[key], fill_value=0).abs()
+        assert diff.max() < 0.05, (key, diff)
+
+
+def test_bundle_partner_always_added_with_probability_one():
+    customers = pd.DataFrame({"customer_id": [1, 2], "join_date": [datetime.date(2023, 1, 1)] * 2, "persona": ["A", "A"]})
+    products = pd.DataFrame({"product_id": ["P1", "P2"], "sku_id": [1, 2], "price": [10.0, 5.0], "category": ["Gadgets", "Gadgets"]})
+    personas = {"A": {"category_prefs": {"Gadgets": 1.0}}}
+    ctx = syndata.build_order_context(customers, products, [{"store_id": 1}], personas, {"P1": ("P2", 1.0)}, ["Gadgets"],
+                                      ["UPI"], [1.0], datetime.date(2023, 1, 1))
+    orders, lines = syndata.generate_orders_batch(ctx, np.random.default_rng(0), 0, 5, 20, 3, 1, 1)
+    baskets = lines.groupby("order_id")["product_id"].agg(set)
+    assert len(orders) == 100
+    assert all("P2" in basket for basket in baskets if "P1" in basket)
+
+
+# --- sharded, seeded generation (user-002) ---------------------------------------------------------------------
+
+def file_bytes(folder, *names):
+    return {name: open(os.path.join(folder, name), "rb").read() for name in names}
+
+
+def test_same_seed_is_byte_identical_across_worker_counts(dataset, tmp_path):
+    parallel = generate(tmp_path, "--workers", "2")
+    names = ("customers.csv", "products.csv", "stores.csv", "orders.csv", "lineitems.csv")
+    assert file_bytes(parallel, *names) == file_bytes(dataset, *names)
+
+
+def test_different_seed_changes_the_output(dataset, tmp_path):
+    other = generate(tmp_path, seed=8)
+    assert file_bytes(other, "orders.csv") != file_bytes(dataset, "orders.csv")
+
+
+# --- streaming writers and resume (user-003) -------------------------------------------------------------------
+
+def interrupt_second_shard(monkeypatch, writer_class):
+    """Make the writer crash halfway through its second shard, leaving partial output on disk."""
+    append, calls = writer_class._append, []
+
+    def crash(self, orders, lineitems):
+        calls.append(1)
+        if len(calls) == 2:
+            append(self, orders.head(5), lineitems.head(0))
+            raise RuntimeError("killed")
+        append(self, orders, lineitems)
+    monkeypatch.setattr(writer_class, "_append", crash)
+
+
+def test_interrupted_run_resumes_to_identical_output(dataset, tmp_path, monkeypatch):
+    interrupt_second_shard(monkeypatch, syndata.CsvShardWriter)
+    with pytest.raises(RuntimeError):
+        generate(tmp_path)
+    monkeypatch.undo()
+    assert os.path.exists(tmp_path / syndata.ShardWriter.PROGRESS_FILE)
+
+    generate(tmp_path, "--resume")
+    assert not os.path.exists(tmp_path / syndata.ShardWriter.PROGRESS_FILE)
+    assert file_bytes(tmp_path, "orders.csv", "lineitems.csv") == file_bytes(dataset, "orders.csv", "lineitems.csv")
+
+
+def test_resume_refuses_different_arguments(tmp_path, monkeypatch):
+    interrupt_second_shard(monkeypatch, syndata.CsvShardWriter)
+    with pytest.raises(RuntimeError):
+        generate(tmp_path)
+    monkeypatch.undo()
+    with pytest.raises(SystemExit, match="different arguments"):
+        generate(tmp_path, "--resume", "--items-per-order", "2")
+
+
+# --- Parquet output (user-004) ---------------------------------------------------------------------------------
+
+def test_resume_refuses_a_different_format(tmp_path, monkeypatch):
+    interrupt_second_shard(monkeypatch, syndata.CsvShardWriter)
+    with pytest.raises(RuntimeError):
+        generate(tmp_path)
+    monkeypatch.undo()
+    with pytest.raises(SystemExit, match="different arguments"):
+        generate(tmp_path, "--resume", "--format", "parquet")
+
+
+def test_shard_writer_is_abstract():
+    with pytest.raises(TypeError):
+        syndata.ShardWriter()